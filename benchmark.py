@@ -0,0 +1,249 @@
+"""benchmark.py: Time the orbit engine, the renderer and number formatting without a display.
+
+Usage example:
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+    python benchmark.py --filter kepler --repeat 9
+
+Each benchmark is run repeat times with enough calls per run to take at least --min-time seconds, and the median
+and minimum time per call are reported. Results are written as JSON together with the commit and library versions,
+so that runs on different commits can be compared with --compare.
+"""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy") # Must be set before pygame opens a display
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import statistics
+import numpy as np
+import pygame
+import simclock
+import catalogue
+from keplerorbit import KeplerOrbit
+from orbitset import OrbitSet
+from eventsearch import EventSearch
+from sciformat import SciFormat
+from scheduler import FixedStepScheduler
+from zoomsprite import OrbitEllipse, Planet
+
+ECCENTRICITIES = (0.0, 0.2, 0.5, 0.9, 0.99)
+SAMPLES = (100, 300, 1000)
+SCREEN_SIZES = ((800, 600), (1920, 1080))
+
+
+def keplerUpdatePosition(e, stepping=False):
+    """Return a function that advances one orbit with eccentricity e by a day and updates its position."""
+    orbit = KeplerOrbit(e=e)
+    orbit.stepping = stepping
+    time = [0.0]
+    def run():
+        time[0] += simclock.DAY
+        orbit.updatePosition(time[0])
+    return run
+
+
+def orbitSetUpdatePositions(stepping=False):
+    """Return a function that advances the planets by a day and updates their positions together."""
+    orbitSet = OrbitSet(*(catalogue.createOrbit(elements) for elements in catalogue.PLANETS))
+    orbitSet.stepping = stepping
+    time = [0.0]
+    def run():
+        time[0] += simclock.DAY
+        orbitSet.updatePositions(time[0])
+    return run
+
+
+def orbitSetApsisTimes(count):
+    """Return a function that computes the next perihelion and aphelion of count main belt orbits."""
+    rng = np.random.default_rng(0)
+    orbitSet = OrbitSet()
+    orbitSet.addElements(rng.uniform(0, 0.3, count), rng.uniform(2.1, 3.3, count) * 149597870700, rng.uniform(3, 6, count) * simclock.YEAR,
+            rng.uniform(0, 2 * np.pi, count), rng.uniform(0, 2 * np.pi, count), rng.uniform(0, 2 * np.pi, count))
+    def run():
+        orbitSet.getPeriapsisTime(0.0)
+        orbitSet.getApoapsisTime(0.0)
+    return run
+
+
+def ellipseCreateVertexList(nSamples):
+    """Return a function that recomputes the vertices of the trace of Pluto with nSamples vertices."""
+    ellipse = OrbitEllipse(catalogue.createOrbit(catalogue.find("Pluto")), (0x50, 0x50, 0x50), nSamples)
+    return ellipse.createVertexList
+
+
+def ellipseRedraw(nSamples, screenSize):
+    """Return a function that projects and draws the trace of Pluto fitted to a screen of screenSize."""
+    ellipse = OrbitEllipse(catalogue.createOrbit(catalogue.find("Pluto")), (0x50, 0x50, 0x50), nSamples)
+    surface = pygame.Surface(screenSize)
+    ellipse.origo = (screenSize[0] // 2, screenSize[1] // 2)
+    ellipse.zoom = min(screenSize) / 2 * OrbitEllipse.scale / (ellipse.orbit.a * (1 + ellipse.orbit.e))
+    def run():
+        ellipse.redraw()
+        ellipse.drawOn(surface)
+    return run
+
+
+def solarSystemUpdate(screenSize, dirtyRendering, showTraces):
+    """Return a function that runs one SolarSystem.update() frame at a speed of one month per second and 30 fps."""
+    from solarsystem import SolarSystem # Opens a display
+    Planet.time = 0.0
+    solarSystem = SolarSystem()
+    solarSystem.eventHandler(pygame.event.Event(pygame.VIDEORESIZE, size=screenSize, w=screenSize[0], h=screenSize[1]))
+    solarSystem.dirtyRendering = dirtyRendering
+    solarSystem.showTraces = showTraces
+    frames = iter(range(sys.maxsize))
+    solarSystem.scheduler = FixedStepScheduler(SolarSystem.TICK_LENGTH, clock=lambda: next(frames) / 30) # 30 fps, whatever the real frame time
+    solarSystem.speedIndex = SolarSystem.SPEED.index((simclock.MONTH, "1 mo/s"))
+    solarSystem.updateTimeStep()
+    solarSystem.update()
+    return solarSystem.update
+
+
+def eventSearch(kind, years):
+    """Return a function that searches all pairs of planets for close approaches, or conjunctions seen from Earth."""
+    orbitSet = OrbitSet(*(catalogue.createOrbit(elements) for elements in catalogue.PLANETS))
+    search = EventSearch(orbitSet)
+    pairs = [(body1, body2) for body1 in range(len(orbitSet)) for body2 in range(body1 + 1, len(orbitSet))]
+    if kind == "conjunctions":
+        earth = catalogue.PLANETS.index(catalogue.find("Earth"))
+        pairs = [pair for pair in pairs if earth not in pair]
+        return lambda: search.conjunctions(pairs, earth, 0.0, years * simclock.YEAR)
+    return lambda: search.closeApproaches(pairs, 0.0, years * simclock.YEAR)
+
+
+def sciFormat(spec):
+    """Return a function that formats a range of numbers with SciFormat and the format spec."""
+    numbers = np.random.default_rng(0).uniform(1e-6, 1e12, 100).tolist()
+    def run():
+        for number in numbers:
+            format(SciFormat(number), spec)
+    return run
+
+
+def sciFormatMany(spec):
+    """Return a function that formats the numbers of sciFormat() with one call to SciFormatter.formatMany()."""
+    numbers = np.random.default_rng(0).uniform(1e-6, 1e12, 100)
+    formatter = SciFormat.compile(spec)
+    return lambda: formatter.formatMany(numbers)
+
+
+def benchmarks():
+    """Return the name and factory of every benchmark. A factory does the setup and returns the function to time."""
+    result = []
+    for e in ECCENTRICITIES:
+        result.append((f"kepler.updatePosition[e={e}]", lambda e=e: keplerUpdatePosition(e)))
+        result.append((f"kepler.updatePosition[e={e},stepping]", lambda e=e: keplerUpdatePosition(e, True)))
+    result.append(("orbitset.updatePositions[planets]", orbitSetUpdatePositions))
+    result.append(("orbitset.updatePositions[planets,stepping]", lambda: orbitSetUpdatePositions(True)))
+    result.append(("orbitset.apsisTimes[100000]", lambda: orbitSetApsisTimes(100000)))
+    for n in SAMPLES:
+        result.append((f"ellipse.createVertexList[n={n}]", lambda n=n: ellipseCreateVertexList(n)))
+    for n in SAMPLES:
+        for size in SCREEN_SIZES:
+            result.append((f"ellipse.redraw[n={n},{size[0]}x{size[1]}]", lambda n=n, size=size: ellipseRedraw(n, size)))
+    for size in SCREEN_SIZES:
+        for dirty, traces in ((True, False), (False, False), (True, True)):
+            name = f"solarsystem.update[{size[0]}x{size[1]},{'dirty' if dirty else 'full'}{',traces' if traces else ''}]"
+            result.append((name, lambda size=size, dirty=dirty, traces=traces: solarSystemUpdate(size, dirty, traces)))
+    for kind in ("closeApproaches", "conjunctions"):
+        result.append((f"eventsearch.{kind}[planets,100y]", lambda kind=kind: eventSearch(kind, 100)))
+    for spec in ("", ".2", "3.02"):
+        result.append((f"sciformat.format[100x'{spec}']", lambda spec=spec: sciFormat(spec)))
+        result.append((f"sciformat.formatMany[100x'{spec}']", lambda spec=spec: sciFormatMany(spec)))
+    return result
+
+
+def measure(run, repeat, minTime):
+    """Time run and return statistics of the time per call in microseconds.
+
+    The number of calls per repetition is doubled until a repetition takes at least minTime seconds.
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= minTime:
+            break
+        loops *= 2
+    times = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        times.append((time.perf_counter() - start) / loops)
+    return {"median": statistics.median(times) * 1e6, "min": min(times) * 1e6, "loops": loops, "repeat": repeat}
+
+
+def environment():
+    """Return the commit and versions that the results depend on."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__, "pygame": pygame.version.ver, "machine": platform.machine()}
+
+
+def compare(results, baseline):
+    """Print the median time of every benchmark next to the baseline and their ratio."""
+    print(f"{'benchmark':56} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for name, current in results.items():
+        if name in baseline:
+            before = baseline[name]["median"]
+            print(f"{name:56} {before:10.2f}us {current['median']:10.2f}us {current['median'] / before:7.2f}")
+        else:
+            print(f"{name:56} {'-':>12} {current['median']:10.2f}us {'-':>7}")
+
+
+def parseArguments(argv):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark the orbit engine, renderer and formatting without a display.")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", metavar="FILE", help="compare with results from an earlier run")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions per benchmark (default: 5)")
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds per repetition (default: 0.05)")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """Run the benchmarks selected on the command line."""
+    args = parseArguments(argv)
+    baseline = None
+    if args.compare != None:
+        try:
+            with open(args.compare) as file:
+                baseline = json.load(file)["results"]
+        except (OSError, ValueError, KeyError) as error:
+            print(f"Error: cannot read {args.compare}: {error}", file=sys.stderr)
+            return 1
+    pygame.init()
+    results = dict()
+    for name, factory in benchmarks():
+        if args.filter in name:
+            results[name] = measure(factory(), args.repeat, args.min_time)
+            if baseline == None:
+                print(f"{name:56} {results[name]['median']:10.2f}us")
+    pygame.quit()
+    if baseline != None:
+        compare(results, baseline)
+    if args.output != None:
+        with open(args.output, "w") as file:
+            json.dump({"environment": environment(), "results": results}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
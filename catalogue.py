@@ -0,0 +1,237 @@
+"""catalogue.py: Orbital elements of solar system bodies and loading of large element files."""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+import os
+import csv
+import json
+import math
+import numpy as np
+import simclock
+from keplerorbit import KeplerOrbit
+from orbitset import OrbitSet
+from lrucache import LRUCache
+
+# Elements at J2000. Semi-major axis a in m, orbital period T in days, angles O, o, M and inclination i in degrees.
+PLANETS = [
+    {"name": "Mercury", "e": 0.21, "a": 57909050000, "T": 87.9691, "O": 48.331, "o": 29.124, "M": 174.796, "i": 7.005},
+    {"name": "Venus", "e": 0.0068, "a": 1.08208628e11, "T": 224.7, "O": 76.680, "o": 54.884, "M": 50.115, "i": 3.39458},
+    {"name": "Earth", "e": 0.0167086, "a": 149.6E9, "T": 365.256363004, "O": 174.9, "o": 288.1, "M": 358.617, "i": 0.00005},
+    {"name": "Mars", "e": 0.0934, "a": 2.27942276e11, "T": 687.0, "O": 49.558, "o": 286.502, "M": 19.412, "i": 1.850},
+    {"name": "Jupiter", "e": 0.0489, "a": 7.7857e11, "T": 4332.59, "O": 100.464, "o": 273.867, "M": 20.020, "i": 1.303},
+    {"name": "Saturn", "e": 0.0565, "a": 1.43353e12, "T": 10759.22, "O": 113.665, "o": 339.392, "M": 317.020, "i": 2.485},
+    {"name": "Uranus", "e": 0.046381, "a": 2.87504e12, "T": 30688.5, "O": 74.006, "o": 96.998857, "M": 142.2386, "i": 0.773},
+    {"name": "Neptune", "e": 0.009456, "a": 4.50439e12, "T": 60182, "O": 131.784, "o": 276.336, "M": 256.228, "i": 1.770},
+    {"name": "Pluto", "e": 0.2488, "a": 5.90638e12, "T": 90560, "O": 110.299, "o": 113.834, "M": 14.53, "i": 17.16}
+]
+
+
+def createOrbit(elements, solver=None):
+    """Create a KeplerOrbit from an element table entry.
+
+    Args:
+        elements (dict): Elements with keys e, a, T, O, o, M and optionally i in the units used by PLANETS.
+        solver (KeplerSolver): Solver for Kepler's equation. Default is KeplerOrbit.defaultSolver.
+
+    Returns:
+        KeplerOrbit: The orbit.
+    """
+    return KeplerOrbit(e=elements["e"], a=elements["a"], T=elements["T"] * 86400, O=math.radians(elements["O"]),
+            o=math.radians(elements["o"]), M=math.radians(elements["M"]), solver=solver, i=math.radians(elements.get("i", 0)))
+
+
+def find(name, bodies=PLANETS):
+    """Return the elements of the body with given name.
+
+    Raises:
+        KeyError: If there is no body with that name.
+    """
+    for elements in bodies:
+        if elements["name"].lower() == name.lower():
+            return elements
+    raise KeyError(name)
+
+
+class Catalogue:
+    """A table of orbital elements for many bodies, with lookup by name, designation and orbital band.
+
+    Elements are kept in arrays. KeplerOrbit objects are only created for bodies that are asked for, and orbit sets
+    for whole selections are built straight from the arrays.
+
+    Class members:
+        BANDS (list of (string, float, float)): Orbital bands as name and range of semi-major axis in AU.
+        MY (float): Standard gravitational parameter of the sun, used when the period is not given.
+        MAX_ORBITS (int): Number of KeplerOrbits created by getOrbit() that are kept for reuse.
+
+    Members:
+        names (list of string): Body names.
+        designations (list of string): Body designations, e.g. a minor planet number. Empty if not known.
+        e, a, T, O, o, M, i (numpy.ndarray): Elements at J2000 in the units of KeplerOrbit. Inclination i in radians.
+        bands (numpy.ndarray): Index into BANDS of every body.
+    """
+    BANDS = [
+        ("Inner", 0.0, 2.0),
+        ("Main belt", 2.0, 3.3),
+        ("Outer belt", 3.3, 5.0),
+        ("Jupiter trojans", 5.0, 5.5),
+        ("Centaurs", 5.5, 30.0),
+        ("Trans-Neptunian", 30.0, math.inf)
+    ]
+    MY = 1.327124400189e20
+    MAX_ORBITS = 4096
+    AU = 149597870700
+    _MPC_MONTHS = "123456789ABC"
+    _MPC_DAYS = "123456789ABCDEFGHIJKLMNOPQRSTUV"
+
+    def __init__(self, bodies=()):
+        """Create a new Catalogue.
+
+        Args:
+            bodies (list of dict): Elements in the format of PLANETS, optionally with designation, inclination i in
+                degrees and epoch as yyyy-mm-dd [H[:M[:S]]]. The period T may be left out and is then computed from a.
+        """
+        self.names, self.designations = [], []
+        columns = {key: [] for key in ("e", "a", "T", "O", "o", "M", "i")}
+        for body in bodies:
+            a = float(body["a"])
+            T = float(body["T"]) * simclock.DAY if body.get("T", "") not in ("", None) else 2 * math.pi * math.sqrt(a**3 / Catalogue.MY)
+            M = math.radians(float(body["M"]))
+            if body.get("epoch", "") not in ("", None):
+                M -= 2 * math.pi * simclock.parse(body["epoch"]) / T # Mean anomaly at J2000
+            self.names.append(str(body.get("name", "")) or str(body.get("designation", "")))
+            self.designations.append(str(body.get("designation", "") or ""))
+            for key, value in (("e", float(body["e"])), ("a", a), ("T", T), ("M", M)):
+                columns[key].append(value)
+            for key in ("O", "o", "i"):
+                columns[key].append(math.radians(float(body.get(key, 0) or 0)))
+        self._setColumns(**columns)
+
+    def _setColumns(self, e, a, T, O, o, M, i):
+        """Store element arrays and build the indices."""
+        self.e, self.a, self.T, self.O, self.o, self.M, self.i = (np.asarray(values, dtype=float) for values in (e, a, T, O, o, M, i))
+        edges = [band[2] for band in Catalogue.BANDS[:-1]]
+        self.bands = np.searchsorted(edges, self.a / Catalogue.AU, side="right")
+        self._byName = dict()
+        for index, name in enumerate(self.names):
+            self._byName.setdefault(name.lower(), index)
+        self._byDesignation = {designation: index for index, designation in enumerate(self.designations) if designation != ""}
+        self._orbits = LRUCache(Catalogue.MAX_ORBITS)
+
+    def __len__(self):
+        """Return the number of bodies."""
+        return len(self.names)
+
+    @staticmethod
+    def load(path):
+        """Load a catalogue from a JSON, CSV or MPCORB file.
+
+        JSON files hold a list of objects and CSV files have a header row, both with the keys described in
+        __init__(). Other files are read as the fixed width MPCORB.DAT format of the Minor Planet Center, where lines
+        that are not element records are skipped.
+
+        Raises:
+            ValueError: If the file cannot be parsed.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        try:
+            if extension == ".json":
+                with open(path) as file:
+                    return Catalogue(json.load(file))
+            elif extension == ".csv":
+                with open(path, newline="") as file:
+                    return Catalogue(csv.DictReader(file))
+            return Catalogue._loadMpc(path)
+        except (KeyError, TypeError) as error:
+            raise ValueError(f"Missing or invalid element in {path}: {error}")
+
+    @staticmethod
+    def _loadMpc(path):
+        """Load a catalogue from an MPCORB.DAT file."""
+        names, designations, rows = [], [], []
+        with open(path, encoding="latin-1") as file:
+            for line in file:
+                if len(line) < 103:
+                    continue
+                try:
+                    epoch = Catalogue._unpackEpoch(line[20:25])
+                    row = [float(line[start:stop]) for start, stop in ((70, 79), (92, 103), (80, 91), (48, 57), (37, 46), (26, 35), (59, 68))]
+                except (ValueError, IndexError):
+                    continue
+                e, a, n, O, o, M, i = row
+                n = math.radians(n) / simclock.DAY
+                rows.append((e, a * Catalogue.AU, 2 * math.pi / n, math.radians(O), math.radians(o), math.radians(M) - n * epoch, math.radians(i)))
+                readable = line[166:194].strip()
+                if readable.startswith("(") and ")" in readable:
+                    number, name = readable[1:].split(")", 1)
+                    designations.append(number)
+                    names.append(name.strip() or number)
+                else:
+                    designations.append(line[0:7].strip())
+                    names.append(readable or line[0:7].strip())
+        if len(rows) == 0:
+            raise ValueError(f"No orbital elements found in {path}")
+        catalogue = Catalogue()
+        catalogue.names, catalogue.designations = names, designations
+        catalogue._setColumns(*np.array(rows).T)
+        return catalogue
+
+    @staticmethod
+    def _unpackEpoch(packed):
+        """Return seconds since J2000 for an MPC packed date such as K239D, at 0h TT."""
+        year = (ord(packed[0]) - ord("A") + 10) * 100 + int(packed[1:3])
+        month = Catalogue._MPC_MONTHS.index(packed[3]) + 1
+        day = Catalogue._MPC_DAYS.index(packed[4]) + 1
+        return simclock.parse(f"{year}-{month}-{day}")
+
+    def find(self, key):
+        """Return the index of the body with given name or designation, ignoring case for names.
+
+        Raises:
+            KeyError: If there is no such body.
+        """
+        key = key.strip()
+        if key in self._byDesignation:
+            return self._byDesignation[key]
+        return self._byName[key.lower()]
+
+    def band(self, name):
+        """Return the indices of all bodies in the orbital band with given name, see BANDS.
+
+        Raises:
+            KeyError: If there is no band with that name.
+        """
+        for index, band in enumerate(Catalogue.BANDS):
+            if band[0].lower() == name.lower():
+                return np.flatnonzero(self.bands == index)
+        raise KeyError(name)
+
+    def getOrbit(self, index, solver=None):
+        """Return a KeplerOrbit for the body at index. The orbit is created on first use and kept while recently used.
+
+        Orbits are cached per solver, so callers asking for different solvers never share an orbit.
+        """
+        return self._orbits.get((int(index), solver), lambda key: self._createOrbit(*key))
+
+    def _createOrbit(self, i, solver):
+        """Return a new KeplerOrbit for the body at index i."""
+        return KeplerOrbit(e=float(self.e[i]), a=float(self.a[i]), T=float(self.T[i]), O=float(self.O[i]),
+                o=float(self.o[i]), M=float(self.M[i]), my=Catalogue.MY, solver=solver, i=float(self.i[i]))
+
+    def orbitSet(self, indices=None, solver=None):
+        """Return an OrbitSet with the bodies at indices, built from the element arrays.
+
+        Args:
+            indices (numpy.ndarray): Indices of the bodies to include. All bodies if None.
+            solver (KeplerSolver): Solver for the set. Default is KeplerOrbit.defaultSolver.
+        """
+        indices = slice(None) if indices is None else indices
+        orbitSet = OrbitSet(solver=solver)
+        orbitSet.addElements(self.e[indices], self.a[indices], self.T[indices], self.O[indices], self.o[indices], self.M[indices], Catalogue.MY, i=self.i[indices])
+        return orbitSet
+
+
+if __name__ == "__main__":
+    print("Warning: catalogue.py is not intended to run stand-alone.")
@@ -0,0 +1,397 @@
+"""ephemeris.py: Generate ephemeris tables without a display and stream them to disk.
+
+Usage example:
+    python ephemeris.py --start 2000-01-01 --stop 2030-01-01 --step 1min --format npy earth.npy --bodies Earth
+    python ephemeris.py --start 2000-01-01 --stop 2100-01-01 --step 1min --workers 32 planets.col --format col
+
+Every row holds the time t in seconds since J2000, the index of the body and its position x, y in m and velocity
+vx, vy in m/s relative to the sun. Rows are ordered by time and then by body. Files in npy and col format can be
+read back with EphemerisTable, e.g. by the animation: python orbits.py --ephemeris planets.col
+"""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+import sys
+import json
+import math
+import types
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import simclock
+import catalogue
+from orbitset import OrbitSet
+
+COLUMNS = ("t", "body", "x", "y", "vx", "vy")
+STEP_UNITS = {"s": 1, "min": simclock.MINUTE, "h": simclock.HOUR, "d": simclock.DAY, "w": simclock.WEEK, "y": simclock.YEAR}
+
+
+class EphemerisWriter:
+    """Base class for writers that receive an ephemeris chunk by chunk.
+
+    Members:
+        path (string): Output file.
+        names (list of string): Body names, indexed by the body column.
+        start (float): Time of the first row in seconds since J2000.
+        step (float): Time between samples in seconds.
+        count (int): Number of samples per body.
+    """
+
+    parallel = False # True if several processes can write to the same file
+
+    def __init__(self, path, names, start, step, count, create=True):
+        """Create a new EphemerisWriter.
+
+        Args:
+            create (bool): Create the file if True. Otherwise open an existing file created with the same arguments.
+        """
+        self.path = path
+        self.names = list(names)
+        self.start = start
+        self.step = step
+        self.count = count
+
+    @property
+    def rows(self):
+        """Return the total number of rows."""
+        return self.count * len(self.names)
+
+    def metadata(self):
+        """Return a dict describing the ephemeris."""
+        return {"columns": list(COLUMNS), "names": self.names, "start": self.start, "step": self.step, "count": self.count}
+
+    def write(self, first, block, bodies=slice(None)):
+        """Override this method to write samples starting at sample index first.
+
+        Args:
+            first (int): Index of the first sample in block.
+            block (numpy.ndarray): Array of shape (samples, bodies, len(COLUMNS)).
+            bodies (slice): The bodies in block. Writers that do not support parallel writes only accept all bodies.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Override this method to finish writing."""
+        pass
+
+
+class CsvWriter(EphemerisWriter):
+    """Write comma separated values with a header line. Chunks must be written in order."""
+
+    def __init__(self, path, names, start, step, count, create=True):
+        super().__init__(path, names, start, step, count, create)
+        self.file = open(path, "w" if create else "a")
+        if create:
+            self.file.write("# bodies: " + ",".join(self.names) + "\n")
+            self.file.write(",".join(COLUMNS) + "\n")
+
+    def write(self, first, block, bodies=slice(None)):
+        rows = block.reshape(-1, len(COLUMNS))
+        np.savetxt(self.file, rows, fmt=("%.3f", "%d", "%.17g", "%.17g", "%.17g", "%.17g"), delimiter=",")
+
+    def close(self):
+        self.file.close()
+
+
+class NpyWriter(EphemerisWriter):
+    """Write a NumPy .npy file of shape (rows, len(COLUMNS)) through a memory map, with metadata in path + ".json"."""
+
+    parallel = True
+
+    def __init__(self, path, names, start, step, count, create=True):
+        super().__init__(path, names, start, step, count, create)
+        if create:
+            self.array = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(self.rows, len(COLUMNS)))
+            with open(path + ".json", "w") as file:
+                json.dump(self.metadata(), file)
+        else:
+            self.array = np.load(path, mmap_mode="r+")
+
+    def write(self, first, block, bodies=slice(None)):
+        self.array.reshape(self.count, len(self.names), len(COLUMNS))[first:first + len(block), bodies] = block
+
+    def close(self):
+        self.array.flush()
+        del self.array
+
+
+class ColumnarWriter(EphemerisWriter):
+    """Write a binary columnar file with each column stored contiguously as little endian float64.
+
+    File layout: the magic bytes b"ORBCOL1\\n", the header length as little endian uint32, a JSON header from
+    metadata() padded with spaces so that the data starts at a multiple of 8 bytes, then one block of rows
+    float64 values per column in the order of COLUMNS.
+    """
+    MAGIC = b"ORBCOL1\n"
+
+    parallel = True
+
+    def __init__(self, path, names, start, step, count, create=True):
+        super().__init__(path, names, start, step, count, create)
+        if create:
+            header = json.dumps(self.metadata()).encode()
+            header += b" " * (-(len(ColumnarWriter.MAGIC) + 4 + len(header)) % 8)
+            with open(path, "wb") as file:
+                file.write(ColumnarWriter.MAGIC + np.uint32(len(header)).tobytes() + header)
+                file.truncate(len(ColumnarWriter.MAGIC) + 4 + len(header) + self.rows * len(COLUMNS) * 8)
+        self.array = ColumnarWriter.open(path, "r+")[1]
+
+    def write(self, first, block, bodies=slice(None)):
+        columns = self.array.reshape(len(COLUMNS), self.count, len(self.names))
+        columns[:, first:first + len(block), bodies] = block.transpose(2, 0, 1)
+
+    def close(self):
+        self.array.flush()
+        del self.array
+
+    @staticmethod
+    def open(path, mode="r"):
+        """Open a columnar file.
+
+        Args:
+            path (string): The file to open.
+            mode (string): Memory map mode, "r" for read only or "r+" for read and write.
+
+        Returns:
+            (dict, numpy.memmap): Metadata and a memory map of shape (len(COLUMNS), rows).
+        """
+        with open(path, "rb") as file:
+            if file.read(len(ColumnarWriter.MAGIC)) != ColumnarWriter.MAGIC:
+                raise ValueError(f"{path} is not a columnar ephemeris file.")
+            length = int(np.frombuffer(file.read(4), dtype="<u4")[0])
+            metadata = json.loads(file.read(length))
+        offset = len(ColumnarWriter.MAGIC) + 4 + length
+        rows = metadata["count"] * len(metadata["names"])
+        return metadata, np.memmap(path, dtype="<f8", mode=mode, offset=offset, shape=(len(COLUMNS), rows))
+
+
+WRITERS = {"csv": CsvWriter, "npy": NpyWriter, "col": ColumnarWriter}
+
+
+class EphemerisTable:
+    """Read an npy or columnar ephemeris file through a memory map and interpolate between its samples.
+
+    Only the samples around the requested time are read, so a lookup costs the same regardless of the length of the
+    table. Positions are interpolated with cubic Hermite polynomials using the stored velocities.
+
+    Members:
+        names (list of string): Body names in the order of the table.
+        start (float): Time of the first sample in seconds since J2000.
+        step (float): Time between samples in seconds.
+        count (int): Number of samples per body.
+    """
+
+    def __init__(self, path):
+        """Open an ephemeris file written by NpyWriter or ColumnarWriter.
+
+        Raises:
+            ValueError: If the file is not an ephemeris file.
+        """
+        with open(path, "rb") as file:
+            columnar = file.read(len(ColumnarWriter.MAGIC)) == ColumnarWriter.MAGIC
+        if columnar:
+            metadata, array = ColumnarWriter.open(path)
+            columns = array.reshape(len(COLUMNS), metadata["count"], len(metadata["names"]))
+        else:
+            try:
+                with open(path + ".json") as file:
+                    metadata = json.load(file)
+            except FileNotFoundError:
+                raise ValueError(f"{path} is not an ephemeris file.")
+            array = np.load(path, mmap_mode="r")
+            columns = array.reshape(metadata["count"], len(metadata["names"]), len(COLUMNS)).transpose(2, 0, 1)
+        self.names = metadata["names"]
+        self.start = metadata["start"]
+        self.step = metadata["step"]
+        self.count = metadata["count"]
+        # Plain ndarray views of the memory map avoid the overhead of numpy.memmap on every lookup
+        self.x, self.y, self.vx, self.vy = (columns[COLUMNS.index(name)].view(np.ndarray) for name in ("x", "y", "vx", "vy"))
+
+    @property
+    def stop(self):
+        """Return the time of the last sample in seconds since J2000."""
+        return self.start + (self.count - 1) * self.step
+
+    def contains(self, t):
+        """Return True if positions can be interpolated at time t."""
+        return self.count > 1 and self.start <= t <= self.stop
+
+    def index(self, names):
+        """Return the table index of each body in names, as a slice if the bodies are consecutive in the table.
+
+        Raises:
+            KeyError: If a body is not in the table.
+        """
+        indices = [self.names.index(name) if name in self.names else self._missing(name) for name in names]
+        if indices == list(range(indices[0], indices[0] + len(indices))):
+            return slice(indices[0], indices[0] + len(indices)) # A slice is faster to index with than a list
+        return indices
+
+    def interpolate(self, t, bodies=slice(None)):
+        """Return positions and velocities at time t.
+
+        Args:
+            t (float): Time in seconds since J2000. Must be within the table, see contains().
+            bodies (slice or list of int): Table indices of the bodies to return, see index().
+
+        Returns:
+            SimpleNamespace: Arrays x, y, vx and vy, and the distance r and speed v of each body.
+        """
+        k = min(int((t - self.start) // self.step), self.count - 2)
+        s = (t - self.start) / self.step - k
+        h = self.step
+        (x0, x1), (y0, y1) = self.x[k:k + 2, bodies], self.y[k:k + 2, bodies]
+        (vx0, vx1), (vy0, vy1) = self.vx[k:k + 2, bodies], self.vy[k:k + 2, bodies]
+        # Cubic Hermite basis functions and their derivatives
+        h00, h10, h01, h11 = 2 * s**3 - 3 * s**2 + 1, s**3 - 2 * s**2 + s, -2 * s**3 + 3 * s**2, s**3 - s**2
+        d00, d10, d01, d11 = 6 * s**2 - 6 * s, 3 * s**2 - 4 * s + 1, -6 * s**2 + 6 * s, 3 * s**2 - 2 * s
+        x = h00 * x0 + h10 * h * vx0 + h01 * x1 + h11 * h * vx1
+        y = h00 * y0 + h10 * h * vy0 + h01 * y1 + h11 * h * vy1
+        vx = (d00 * x0 + d01 * x1) / h + d10 * vx0 + d11 * vx1
+        vy = (d00 * y0 + d01 * y1) / h + d10 * vy0 + d11 * vy1
+        return types.SimpleNamespace(x=x, y=y, vx=vx, vy=vy, r=np.hypot(x, y), v=np.hypot(vx, vy))
+
+    @staticmethod
+    def _missing(name):
+        raise KeyError(f"{name} is not in the ephemeris.")
+
+
+def sampleCount(start, stop, step):
+    """Return the number of samples start, start + step, ... that are not after stop."""
+    return math.floor((stop - start) / step + 1e-9) + 1
+
+
+def computeBlock(orbitSet, start, step, first, count, firstBody=0):
+    """Compute samples first to first + count for all orbits in orbitSet.
+
+    Args:
+        firstBody (int): Body index of the first orbit in orbitSet.
+
+    Returns:
+        numpy.ndarray: Array of shape (count, len(orbitSet), len(COLUMNS)).
+    """
+    t = start + (first + np.arange(count)) * step
+    positions = orbitSet.getPositions(t, velocity=True)
+    block = np.empty((count, len(orbitSet), len(COLUMNS)))
+    block[:, :, 0] = t[:, np.newaxis]
+    block[:, :, 1] = firstBody + np.arange(len(orbitSet))
+    for column, name in enumerate(COLUMNS[2:], 2):
+        block[:, :, column] = getattr(positions, name).T
+    return block
+
+
+def generate(orbitSet, writer, chunkSize=10000):
+    """Propagate all orbits over the time range of writer and write the result chunk by chunk.
+
+    Args:
+        orbitSet (OrbitSet): The bodies to propagate, in the order of writer.names.
+        writer (EphemerisWriter): Receives the rows.
+        chunkSize (int): Number of samples per body and chunk. Bounds memory use.
+    """
+    for first in range(0, writer.count, chunkSize):
+        count = min(chunkSize, writer.count - first)
+        writer.write(first, computeBlock(orbitSet, writer.start, writer.step, first, count))
+    writer.close()
+
+
+def generateParallel(bodies, writer, workers, shard="time", chunkSize=10000):
+    """Propagate bodies over the time range of writer in several processes.
+
+    Each process opens the output file itself and writes its share of the table directly to it, so no results
+    are sent back to this process.
+
+    Args:
+        bodies (list of dict): Elements of the bodies in the order of writer.names. See catalogue.PLANETS.
+        writer (EphemerisWriter): A writer with parallel set to True. It is closed before the workers start.
+        workers (int): Number of processes.
+        shard (string): "time" to give each process a block of time for all bodies, or "body" to give each process
+            a group of bodies for the whole time range.
+        chunkSize (int): Number of samples per body and chunk in each process.
+
+    Raises:
+        ValueError: If writer does not support parallel writes.
+    """
+    if not writer.parallel:
+        raise ValueError(f"{type(writer).__name__} does not support parallel writes.")
+    writer.close()
+    if shard == "body":
+        edges = np.linspace(0, len(bodies), min(workers, len(bodies)) + 1).astype(int)
+        shards = [(0, writer.count, first, last) for first, last in zip(edges[:-1], edges[1:])]
+    else:
+        edges = np.linspace(0, writer.count, min(workers * 4, writer.count) + 1).astype(int) # Several blocks per process to balance load
+        shards = [(first, last, 0, len(bodies)) for first, last in zip(edges[:-1], edges[1:])]
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(_generateShard, type(writer), writer.path, bodies, writer.start, writer.step, writer.count, *shard, chunkSize) for shard in shards]
+        for future in futures:
+            future.result() # Raise any exception from the workers
+
+
+def _generateShard(writerType, path, bodies, start, step, count, firstSample, lastSample, firstBody, lastBody, chunkSize):
+    """Compute and write samples firstSample to lastSample of bodies firstBody to lastBody. Runs in a worker process."""
+    writer = writerType(path, [elements["name"] for elements in bodies], start, step, count, create=False)
+    orbitSet = OrbitSet(*(catalogue.createOrbit(elements) for elements in bodies[firstBody:lastBody]))
+    for first in range(firstSample, lastSample, chunkSize):
+        block = computeBlock(orbitSet, start, step, first, min(chunkSize, lastSample - first), firstBody)
+        writer.write(first, block, slice(firstBody, lastBody))
+    writer.close()
+
+
+def parseStep(text):
+    """Parse a time step such as 60, 60s, 1min, 6h, 1d, 1w or 1y.
+
+    Returns:
+        float: The step in seconds.
+    """
+    number = text.rstrip("abcdefghijklmnopqrstuvwxyz")
+    unit = text[len(number):] or "s"
+    if unit not in STEP_UNITS:
+        raise ValueError(f"Unknown time unit: {unit}")
+    step = float(number) * STEP_UNITS[unit]
+    if step <= 0:
+        raise ValueError("The step must be positive.")
+    return step
+
+
+def parseArguments(argv):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Generate an ephemeris without a display.")
+    parser.add_argument("output", help="output file")
+    parser.add_argument("--start", required=True, help="first date, yyyy-mm-dd [H[:M[:S]]]")
+    parser.add_argument("--stop", required=True, help="last date, yyyy-mm-dd [H[:M[:S]]]")
+    parser.add_argument("--step", default="1d", help="time step, e.g. 60, 1min, 6h, 1d (default: 1d)")
+    parser.add_argument("--format", choices=WRITERS.keys(), default="npy", help="output format (default: npy)")
+    parser.add_argument("--bodies", help="comma separated body names (default: all planets)")
+    parser.add_argument("--chunk", type=int, default=10000, help="samples per body and chunk (default: 10000)")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes, not supported for csv (default: 1)")
+    parser.add_argument("--shard", choices=("time", "body"), default="time", help="split work between processes by time or by body (default: time)")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """Generate an ephemeris as specified on the command line."""
+    args = parseArguments(argv)
+    try:
+        start, stop, step = simclock.parse(args.start), simclock.parse(args.stop), parseStep(args.step)
+        bodies = [catalogue.find(name) for name in args.bodies.split(",")] if args.bodies else catalogue.PLANETS
+    except (ValueError, KeyError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    if stop < start:
+        print("Error: stop is before start.", file=sys.stderr)
+        return 1
+    if args.workers > 1 and not WRITERS[args.format].parallel:
+        print(f"Error: {args.format} output can only be written by one process.", file=sys.stderr)
+        return 1
+    writer = WRITERS[args.format](args.output, [elements["name"] for elements in bodies], start, step, sampleCount(start, stop, step))
+    if args.workers > 1:
+        generateParallel(bodies, writer, args.workers, args.shard, args.chunk)
+    else:
+        generate(OrbitSet(*(catalogue.createOrbit(elements) for elements in bodies)), writer, args.chunk)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
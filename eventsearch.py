@@ -0,0 +1,330 @@
+"""eventsearch.py: Find close approaches, conjunctions and oppositions of bodies in Kepler orbits.
+
+Usage example:
+    python eventsearch.py --start 2000-01-01 --stop 2100-01-01 --approaches Earth-Mars
+    python eventsearch.py --start 0-01-01 --stop 3000-01-01 --conjunctions Jupiter-Saturn,Mars-Sun --oppositions Mars
+
+The time range is first sampled on a regular grid with all bodies propagated together, and every local minimum on
+the grid is then refined with parabolic interpolation and golden-section steps on the Kepler orbits, all minima at
+once. Conjunctions and oppositions are seen from the observer, Earth by default, using positions in three dimensions.
+"""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+import sys
+import math
+import types
+import argparse
+import numpy as np
+import simclock
+import catalogue
+from orbitset import OrbitSet
+
+SUN = None # Body index of the central body
+
+
+class EventSearch:
+    """Search an OrbitSet for the times when functions of the positions of its bodies have a minimum.
+
+    Bodies are given by their index in the OrbitSet, or SUN for the central body. All searches return events as a
+    SimpleNamespace with arrays t (seconds since epoch), pair (index into the given pairs or bodies) and value,
+    sorted by time. Minima closer to each other than a grid step may be missed, so step must be short compared to
+    how fast the searched function changes. The default step is a twentieth of the shortest orbital period
+    involved, which is enough for the smooth functions of planets, but not for the short and deep minima of close
+    encounters of small bodies.
+
+    Members:
+        orbitSet (OrbitSet): The orbits searched.
+        tolerance (float): Events are located to within this many seconds.
+        chunkSize (int): Number of grid samples evaluated at once.
+    """
+    STEPS_PER_PERIOD = 20
+    MAX_ITERATIONS = 100
+    _GOLDEN_STEP = (3 - math.sqrt(5)) / 2
+
+    def __init__(self, orbitSet, tolerance=60.0, chunkSize=10000):
+        """Create a new EventSearch.
+
+        Args:
+            orbitSet (OrbitSet): The orbits to search.
+            tolerance (float): Events are located to within this many seconds.
+            chunkSize (int): Number of grid samples evaluated at once.
+        """
+        self.orbitSet = orbitSet
+        self.tolerance = tolerance
+        self.chunkSize = chunkSize
+
+    def closeApproaches(self, pairs, start, stop, step=None, maxDistance=math.inf):
+        """Find the local minima of the distance between two bodies.
+
+        Args:
+            pairs (list of (int, int)): The bodies of each pair.
+            start, stop (float): Time range in seconds since epoch.
+            step (float): Sampling step in seconds. Default is based on the orbital periods, see EventSearch.
+            maxDistance (float): Leave out approaches farther than this many m.
+
+        Returns:
+            SimpleNamespace: Arrays t, pair and value, the distance in m.
+        """
+        events = self._search(pairs, EventSearch._distance, start, stop, step)
+        return EventSearch._select(events, events.value <= maxDistance)
+
+    def conjunctions(self, pairs, observer, start, stop, step=None, maxSeparation=math.pi):
+        """Find the local minima of the angle between two bodies as seen from an observer.
+
+        Conjunctions with the sun are found with SUN as one body of a pair. Minima of the angle that are not
+        conjunctions in longitude, e.g. when inclined orbits pass each other at a distance, are also found unless
+        left out with maxSeparation.
+
+        Args:
+            pairs (list of (int, int)): The bodies of each pair.
+            observer (int): The body seen from.
+            start, stop (float): Time range in seconds since epoch.
+            step (float): Sampling step in seconds. Default is based on the orbital periods, see EventSearch.
+            maxSeparation (float): Leave out conjunctions with a larger angle between the bodies, in radians.
+
+        Returns:
+            SimpleNamespace: Arrays t, pair and value, the angle between the bodies in radians.
+        """
+        triples = [(body1, body2, observer) for body1, body2 in pairs]
+        events = self._search(triples, EventSearch._separation, start, stop, step)
+        return EventSearch._select(events, events.value <= maxSeparation)
+
+    def oppositions(self, bodies, observer, start, stop, step=None, minElongation=0.0):
+        """Find the local maxima of the angle between a body and the sun as seen from an observer.
+
+        Args:
+            bodies (list of int): The bodies.
+            observer (int): The body seen from, typically one closer to the sun than bodies.
+            start, stop (float): Time range in seconds since epoch.
+            step (float): Sampling step in seconds. Default is based on the orbital periods, see EventSearch.
+            minElongation (float): Leave out maxima with a smaller angle to the sun, in radians.
+
+        Returns:
+            SimpleNamespace: Arrays t, pair and value, the angle between the body and the sun (elongation) in radians.
+        """
+        triples = [(body, SUN, observer) for body in bodies]
+        events = self._search(triples, lambda positions: -EventSearch._separation(positions), start, stop, step)
+        events.value = -events.value
+        return EventSearch._select(events, events.value >= minElongation)
+
+    def _search(self, groups, function, start, stop, step=None):
+        """Return the refined local minima of function over groups of bodies.
+
+        Args:
+            groups (list of tuple of int): The bodies of each group.
+            function (callable): Function of a list with the positions of the bodies of a group, each shaped
+                (3, ...), returning values shaped (...).
+            start, stop (float): Time range in seconds since epoch.
+            step (float): Sampling step in seconds, or None to sample each group by its shortest orbital period.
+        """
+        bodies = np.array([[-1 if body is SUN else body for body in group] for group in groups], dtype=int).reshape(len(groups), -1)
+        if step == None:
+            periods = np.where(bodies >= 0, self.orbitSet.T[np.maximum(bodies, 0)], math.inf).min(axis=1)
+            steps = np.where(np.isfinite(periods), periods / EventSearch.STEPS_PER_PERIOD, max(stop - start, 1.0))
+        else:
+            steps = np.full(len(groups), float(step))
+        t, group, value = [np.empty(0)], [np.empty(0, dtype=int)], [np.empty(0)]
+        for groupStep in np.unique(steps): # Groups of slowly moving bodies are sampled more sparsely
+            indices = np.flatnonzero(steps == groupStep)
+            # Sample a step beyond both ends so that minima near start and stop are bracketed
+            row, times, values = self._sample(bodies[indices], function, start - groupStep, stop + groupStep, groupStep)
+            times, values = self._refine(bodies[indices[row]], function, times, values)
+            inRange = (times >= start) & (times <= stop)
+            t.append(times[inRange])
+            group.append(indices[row[inRange]])
+            value.append(values[inRange])
+        t, group, value = np.concatenate(t), np.concatenate(group), np.concatenate(value)
+        order = np.argsort(t, kind="stable")
+        return types.SimpleNamespace(t=t[order], pair=group[order], value=value[order])
+
+    def _sample(self, bodies, function, start, stop, step):
+        """Find the local minima of function on a grid of times from start to stop.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray, numpy.ndarray): Row in bodies of each minimum, and the times and values of
+                the samples before, at and after it, shaped (minima, 3).
+        """
+        unique, inverse = np.unique(bodies, return_inverse=True)
+        inverse = inverse.reshape(bodies.shape)
+        count = int((stop - start) // step) + 1
+        rows, times, values = [], [], []
+        for first in range(0, count, self.chunkSize):
+            last = min(first + self.chunkSize, count)
+            k = np.arange(max(first - 1, 0), min(last + 1, count))
+            positions = self._positions(unique[:, np.newaxis], start + step * k) # (3, bodies, samples), each body once
+            chunk = function([positions[:, inverse[:, column]] for column in range(bodies.shape[1])])
+            row, column = np.nonzero((chunk[:, 1:-1] < chunk[:, :-2]) & (chunk[:, 1:-1] <= chunk[:, 2:]))
+            inChunk = (k[column + 1] >= first) & (k[column + 1] < last) # Samples next to the chunk are only for comparison
+            row, column = row[inChunk], column[inChunk]
+            rows.append(row)
+            times.append(start + step * k[column[:, np.newaxis] + np.arange(3)])
+            values.append(chunk[row[:, np.newaxis], column[:, np.newaxis] + np.arange(3)])
+        return np.concatenate(rows), np.concatenate(times).reshape(-1, 3), np.concatenate(values).reshape(-1, 3)
+
+    def _refine(self, bodies, function, times, values):
+        """Narrow down every bracketed minimum of function to within tolerance.
+
+        Each step tries the minimum of the parabola through the best point and the ends of its bracket, which
+        converges in a few evaluations for smooth minima. As in Brent's method, a golden-section step into the larger
+        half of the bracket is taken instead when the parabola is not usable or its step is not shorter than half
+        the step before last, so that every bracket keeps shrinking. A bracket is done when it is narrower than
+        twice the tolerance, and is then dropped from the computation.
+
+        Args:
+            bodies (numpy.ndarray): The bodies of the group of each bracket, shaped (brackets, bodies per group).
+            function (callable): See _search().
+            times, values (numpy.ndarray): Time and value at the start, minimum and end of each bracket, shaped
+                (brackets, 3).
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray): Time and value of every minimum.
+        """
+        a, m, b = (times[:, column].copy() for column in range(3))
+        fa, fm, fb = (values[:, column].copy() for column in range(3))
+        active = np.arange(len(m))
+        step, lastStep = np.zeros(len(m)), b - a # The latest step and the one before it
+        for _ in range(EventSearch.MAX_ITERATIONS):
+            if len(active) == 0:
+                break
+            ta, tm, tb, va, vm, vb = a[active], m[active], b[active], fa[active], fm[active], fb[active]
+            p = (tm - ta)**2 * (vm - vb) - (tm - tb)**2 * (vm - va)
+            q = 2 * ((tm - ta) * (vm - vb) - (tm - tb) * (vm - va))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                u = tm - p / q
+            right = tb - tm > tm - ta
+            golden = np.where(right, tm + EventSearch._GOLDEN_STEP * (tb - tm), tm - EventSearch._GOLDEN_STEP * (tm - ta))
+            parabolic = np.isfinite(u) & (u > ta) & (u < tb) & (np.abs(u - tm) < 0.5 * np.abs(lastStep[active]))
+            lastStep[active] = np.where(parabolic, step[active], np.where(right, tb - tm, ta - tm))
+            u = np.where(parabolic, u, golden)
+            # Never evaluate closer to the best point than half the tolerance, where the values are mostly rounding
+            u = np.where(np.abs(u - tm) < self.tolerance / 2, tm + np.where(right, 0.5, -0.5) * self.tolerance, u)
+            step[active] = u - tm
+            vu = self._evaluate(bodies[active], function, u)
+            better, left = vu < vm, u < tm
+            a[active] = np.where(better, np.where(left, ta, tm), np.where(left, u, ta))
+            fa[active] = np.where(better, np.where(left, va, vm), np.where(left, vu, va))
+            b[active] = np.where(better, np.where(left, tm, tb), np.where(left, tb, u))
+            fb[active] = np.where(better, np.where(left, vm, vb), np.where(left, vb, vu))
+            m[active], fm[active] = np.where(better, u, tm), np.where(better, vu, vm)
+            active = active[b[active] - a[active] >= 2 * self.tolerance]
+        return m, fm
+
+    def _evaluate(self, bodies, function, t):
+        """Return function of the positions of each group of bodies at the corresponding time in t."""
+        return function([self._positions(bodies[:, column], t) for column in range(bodies.shape[1])])
+
+    def _positions(self, bodies, t):
+        """Return the positions of bodies at times t in three dimensions, shaped (3,) + the broadcast shape.
+
+        Element i of bodies is at t[i] if the arrays have the same shape, or every body at every time for bodies
+        shaped (n, 1) and t shaped (m,). The central body, index -1, is at the origin.
+        """
+        s = self.orbitSet
+        index = np.maximum(bodies, 0)
+        positions = OrbitSet._propagate(s.solver, t, s.e[index], s.a[index], s.T[index], s.O[index], s.o[index],
+                s.M[index], s.my[index], i=s.i[index])
+        return np.where(bodies >= 0, np.stack((positions.x, positions.y, positions.z)), 0.0)
+
+    @staticmethod
+    def _distance(positions):
+        """Return the distance between the first two bodies."""
+        return np.sqrt(np.sum((positions[0] - positions[1])**2, axis=0))
+
+    @staticmethod
+    def _separation(positions):
+        """Return the angle between the first two bodies as seen from the third."""
+        u, w = positions[0] - positions[2], positions[1] - positions[2]
+        return np.arctan2(np.linalg.norm(np.cross(u, w, axis=0), axis=0), np.sum(u * w, axis=0))
+
+    @staticmethod
+    def _select(events, mask):
+        """Return the events where mask is True."""
+        return types.SimpleNamespace(t=events.t[mask], pair=events.pair[mask], value=events.value[mask])
+
+
+def parsePairs(text, names):
+    """Parse body pairs such as Earth-Mars,Jupiter-Saturn into pairs of indices into names. Sun gives SUN.
+
+    Raises:
+        ValueError: If a pair is not two names separated by a dash.
+        KeyError: If a body is not in names.
+    """
+    pairs = []
+    for pair in text.split(","):
+        bodies = pair.split("-")
+        if len(bodies) != 2:
+            raise ValueError(f"Invalid pair: {pair}")
+        pairs.append(tuple(parseBody(body, names) for body in bodies))
+    return pairs
+
+
+def parseBody(name, names):
+    """Return the index of the body with name in names ignoring case, or SUN for the sun.
+
+    Raises:
+        KeyError: If there is no such body.
+    """
+    if name.strip().lower() == "sun":
+        return SUN
+    lowered = [known.lower() for known in names]
+    if name.strip().lower() not in lowered:
+        raise KeyError(name)
+    return lowered.index(name.strip().lower())
+
+
+def parseArguments(argv):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="List close approaches, conjunctions and oppositions of the planets.")
+    parser.add_argument("--start", required=True, help="first date, yyyy-mm-dd [H[:M[:S]]]")
+    parser.add_argument("--stop", required=True, help="last date, yyyy-mm-dd [H[:M[:S]]]")
+    parser.add_argument("--approaches", help="comma separated pairs of bodies, e.g. Earth-Mars")
+    parser.add_argument("--conjunctions", help="comma separated pairs of bodies, e.g. Jupiter-Saturn,Venus-Sun")
+    parser.add_argument("--oppositions", help="comma separated bodies, e.g. Mars,Jupiter")
+    parser.add_argument("--observer", default="Earth", help="body that conjunctions and oppositions are seen from (default: Earth)")
+    parser.add_argument("--max-separation", type=float, default=10.0, help="largest angle of listed conjunctions in degrees (default: 10)")
+    parser.add_argument("--tolerance", type=float, default=60.0, help="accuracy of event times in seconds (default: 60)")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """Print the events specified on the command line in time order."""
+    args = parseArguments(argv)
+    names = [elements["name"] for elements in catalogue.PLANETS]
+    try:
+        start, stop = simclock.parse(args.start), simclock.parse(args.stop)
+        approaches = parsePairs(args.approaches, names) if args.approaches else []
+        conjunctions = parsePairs(args.conjunctions, names) if args.conjunctions else []
+        oppositions = [parseBody(name, names) for name in args.oppositions.split(",")] if args.oppositions else []
+        observer = parseBody(args.observer, names)
+    except (ValueError, KeyError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    if stop < start:
+        print("Error: stop is before start.", file=sys.stderr)
+        return 1
+    if SUN in oppositions or ((conjunctions or oppositions) and observer is SUN):
+        print("Error: oppositions of the sun and events seen from the sun are not supported.", file=sys.stderr)
+        return 1
+    search = EventSearch(OrbitSet(*(catalogue.createOrbit(elements) for elements in catalogue.PLANETS)), args.tolerance)
+    label = lambda body: "Sun" if body is SUN else names[body]
+    lines = []
+    if approaches:
+        events = search.closeApproaches(approaches, start, stop)
+        lines += [(t, f"{label(approaches[pair][0])}-{label(approaches[pair][1])} close approach, {value / 1000:.4e} km") for t, pair, value in zip(events.t, events.pair, events.value)]
+    if conjunctions:
+        events = search.conjunctions(conjunctions, observer, start, stop, maxSeparation=math.radians(args.max_separation))
+        lines += [(t, f"{label(conjunctions[pair][0])}-{label(conjunctions[pair][1])} conjunction, {math.degrees(value):.3f} deg") for t, pair, value in zip(events.t, events.pair, events.value)]
+    if oppositions:
+        events = search.oppositions(oppositions, observer, start, stop)
+        lines += [(t, f"{label(oppositions[pair])} opposition, {math.degrees(value):.3f} deg from the sun") for t, pair, value in zip(events.t, events.pair, events.value)]
+    for t, text in sorted(lines, key=lambda line: line[0]):
+        print(f"{simclock.formatTime(t)}  {text}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -7,20 +7,31 @@ __contact__ = "andreas.andersson@tutanota.com"
 
 import math
 import datetime
+import types
+import numpy as np
+from keplersolver import NewtonSolver
 
 class KeplerOrbit:
-    """Calculate planetary orbits."""
-    _maxIterations = 100
-    _accuracy = 0.0000000001
+    """Calculate planetary orbits.
 
-    def __init__(self, e=0.0167086, a=149.6E9, T=(365.256363004 * 24 * 60 * 60), O=(174.9 * math.pi / 180), o=(288.1 * math.pi / 180), M=(358.617 * math.pi / 180), my=1.327124400189e20):
+    Class members:
+        defaultSolver (KeplerSolver): Solver used by orbits that are not given one explicitly.
+    """
+    defaultSolver = NewtonSolver()
+
+    def __init__(self, e=0.0167086, a=149.6E9, T=(365.256363004 * 24 * 60 * 60), O=(174.9 * math.pi / 180), o=(288.1 * math.pi / 180), M=(358.617 * math.pi / 180), my=1.327124400189e20, solver=None, i=0.0):
         """Initialize a new orbit. Earth data is used as default values.
 
         Members:
         epoch (datetime.datetime): Reference time in terrestrial time. Default is J2000.
+        E (float): Eccentric anomaly in radians.
         f (float): True anomaly in radians.
         r (float): Distance to central body in m.
         v (float): Speed in m/s.
+        residual (float): Residual of Kepler's equation after the latest solve.
+        iterations (int): Number of solver iterations used by the latest solve.
+        stepping (bool): If True, updatePosition() starts from the previous eccentric anomaly when time moves forward
+            by a small step, which usually needs one Newton correction instead of a full solve. Default is False.
         
         Args:
         e (float): Eccentricity.
@@ -30,6 +41,9 @@ class KeplerOrbit:
         o (float): Argument of periapsis in radians.
         M (float): Mean anomaly at epoch in radians.
         my (float): Standard gravitational parameter for the central body. Default value is my for the sun.
+        solver (KeplerSolver): Solver for Kepler's equation. Default is KeplerOrbit.defaultSolver.
+        i (float): Inclination to the reference plane in radians. Only used by three dimensional positions, the
+            two dimensional ones are in the plane of the orbit rotated by O + o.
         """
         self.e = e
         self.a = a
@@ -38,23 +52,104 @@ class KeplerOrbit:
         self.o = o
         self.M = M
         self.my = my
+        self.i = i
+        self.solver = solver if solver != None else KeplerOrbit.defaultSolver
+        self.solver.prepare(e)
         self.epoch = datetime.datetime(2000, 1, 1, 12)
-        self.f, self.r, self.v = None, None, None
+        self.E, self.f, self.r, self.v = None, None, None, None
+        self.residual, self.iterations = None, None
+        self.stepping = False
+        self._stepState = None
         self.updatePosition(self.epoch) # Initialize f, r and v
 
     def updatePosition(self, time):
         """update the planetary position for given time.
         
         Args:
-            time (datetime.datetime): Date and time for the position to update to.
+            time (float or datetime.datetime): Seconds since epoch, or date and time for the position to update to.
         """
-        t = (time - self.epoch).total_seconds()
+        t = (time - self.epoch).total_seconds() if isinstance(time, datetime.datetime) else time
         M = self._getMeanAnomaly(t) + self.M
-        E = self._getEccentricAnomaly(M)
-        self.f = self._getTrueAnomaly(E)
-        self.r = self._getDistance(E)
+        self.E = self._getEccentricAnomaly(M)
+        self.f = self._getTrueAnomaly(self.E)
+        self.r = self._getDistance(self.E)
         self.v = self._getSpeed()
 
+    def getPositions(self, t, velocity=False, dimensions=2):
+        """Return positions for many points in time without changing the state of the orbit.
+
+        Args:
+            t (numpy.ndarray): Times in seconds since epoch.
+            velocity (bool): Also return the velocity components in m/s if True.
+            dimensions (int): 2 for positions in the plane of the orbit, 3 to also tilt the orbit by the inclination.
+
+        Returns:
+            SimpleNamespace: Arrays f (true anomaly), r (distance), v (speed), x and y shaped like t, z if dimensions
+                is 3 and vx, vy (and vz) if velocity is True.
+        """
+        t = np.asarray(t, dtype=float)
+        M = self._getMeanAnomaly(t) + self.M
+        E = self._getEccentricAnomalies(M)
+        f = 2 * np.arctan(math.sqrt((1 + self.e) / (1 - self.e)) * np.tan(E / 2))
+        r = self.a * (1 - self.e * np.cos(E))
+        v = np.sqrt(self.my * (2 / r - 1 / self.a))
+        positions = types.SimpleNamespace(f=f, r=r, v=v)
+        if dimensions == 2 and not velocity:
+            phi = f + self.O + self.o
+            positions.x, positions.y = r * np.cos(phi), r * np.sin(phi)
+        else:
+            state = KeplerOrbit.stateVectors(E, self.e, self.a, self.T, self.O, self.o, self.i if dimensions == 3 else None)
+            for name, value in vars(state).items():
+                if velocity or not name.startswith("v"):
+                    setattr(positions, name, value)
+        return positions
+
+    def getStateVector(self, dimensions=2):
+        """Return position and velocity at the time of the latest updatePosition(), without solving again.
+
+        Args:
+            dimensions (int): 2 for the plane of the orbit, 3 to also tilt the orbit by the inclination.
+
+        Returns:
+            (tuple of float, tuple of float): Position (x, y[, z]) in m and velocity (vx, vy[, vz]) in m/s.
+        """
+        state = KeplerOrbit.stateVectors(self.E, self.e, self.a, self.T, self.O, self.o, self.i if dimensions == 3 else None)
+        if dimensions == 3:
+            return (float(state.x), float(state.y), float(state.z)), (float(state.vx), float(state.vy), float(state.vz))
+        return (float(state.x), float(state.y)), (float(state.vx), float(state.vy))
+
+    @staticmethod
+    def stateVectors(E, e, a, T, O, o, i=None):
+        """Return position and velocity given the eccentric anomaly, for numbers or broadcastable arrays.
+
+        The state is first computed in the plane of the orbit with periapsis along the x axis and then rotated by
+        the argument of periapsis, the inclination and the longitude of the ascending node. The velocity uses the
+        mean motion 2 * pi / T, so it agrees with the positions also when T and my are not exactly consistent.
+
+        Args:
+            E (float or numpy.ndarray): Eccentric anomaly in radians.
+            e, a, T, O, o (float or numpy.ndarray): Elements, see KeplerOrbit.
+            i (float or numpy.ndarray): Inclination in radians, or None for two dimensional state vectors in the
+                plane of the orbit rotated by O + o.
+
+        Returns:
+            SimpleNamespace: Position x, y (and z) in m and velocity vx, vy (and vz) in m/s.
+        """
+        sinE, cosE = np.sin(E), np.cos(E)
+        b = a * np.sqrt(1 - e * e)
+        k = 2 * np.pi / (T * (1 - e * cosE)) # dE/dt
+        xp, yp = a * (cosE - e), b * sinE
+        vxp, vyp = -a * k * sinE, b * k * cosE
+        if i is None:
+            cosw, sinw = np.cos(O + o), np.sin(O + o)
+            return types.SimpleNamespace(x=xp * cosw - yp * sinw, y=xp * sinw + yp * cosw, vx=vxp * cosw - vyp * sinw, vy=vxp * sinw + vyp * cosw)
+        cosO, sinO, coso, sino, cosi, sini = np.cos(O), np.sin(O), np.cos(o), np.sin(o), np.cos(i), np.sin(i)
+        # Columns of the rotation from the plane of the orbit to the reference frame
+        px, py, pz = cosO * coso - sinO * sino * cosi, sinO * coso + cosO * sino * cosi, sino * sini
+        qx, qy, qz = -cosO * sino - sinO * coso * cosi, -sinO * sino + cosO * coso * cosi, coso * sini
+        return types.SimpleNamespace(x=xp * px + yp * qx, y=xp * py + yp * qy, z=xp * pz + yp * qz,
+                vx=vxp * px + vyp * qx, vy=vxp * py + vyp * qy, vz=vxp * pz + vyp * qz)
+
     def getCartesianPosition(self):
         """Return the position relative to the central body in cartesian coordinates."""
         phi = self.f + self.O + self.o
@@ -62,18 +157,71 @@ class KeplerOrbit:
         y = self.r * math.sin(phi)
         return (x, y)
 
+    def getCartesianVelocity(self):
+        """Return the velocity in cartesian coordinates, in the same plane as getCartesianPosition()."""
+        return self.getStateVector(2)[1]
+
+    def getTimeOfTrueAnomaly(self, f, t=0.0, forward=True):
+        """Return when the true anomaly is f, solved directly from the mean motion without sampling the orbit.
+
+        Args:
+            f (float or numpy.ndarray): True anomaly in radians.
+            t (float or numpy.ndarray): Time in seconds since epoch to search from.
+            forward (bool): Return the first time at or after t if True, else the last time at or before t.
+
+        Returns:
+            float or numpy.ndarray: Seconds since epoch, shaped like f and t broadcast together.
+        """
+        return KeplerOrbit.timeOfTrueAnomaly(f, t, self.e, self.T, self.M, forward)
+
+    def getPeriapsisTime(self, t=0.0, forward=True):
+        """Return the time of the next periapsis (perihelion for the sun) at or after t, or the previous one if not forward."""
+        return self.getTimeOfTrueAnomaly(0.0, t, forward)
+
+    def getApoapsisTime(self, t=0.0, forward=True):
+        """Return the time of the next apoapsis (aphelion for the sun) at or after t, or the previous one if not forward."""
+        return self.getTimeOfTrueAnomaly(math.pi, t, forward)
+
+    def getNodeTime(self, t=0.0, ascending=True, forward=True):
+        """Return the time of the next crossing of the reference plane at or after t, or the previous one if not forward.
+
+        The ascending node is where the orbit passes the plane northwards, at true anomaly -o, and the descending node
+        is at pi - o. For an orbit without inclination these are the points at longitude O and O + pi.
+        """
+        return self.getTimeOfTrueAnomaly(-self.o if ascending else math.pi - self.o, t, forward)
+
+    @staticmethod
+    def timeOfTrueAnomaly(f, t, e, T, M, forward=True):
+        """Return when orbits reach true anomaly f, for numbers or broadcastable arrays. See getTimeOfTrueAnomaly().
+
+        Args:
+            f (float or numpy.ndarray): True anomaly in radians.
+            t (float or numpy.ndarray): Time in seconds since epoch to search from.
+            e, T, M (float or numpy.ndarray): Elements, see KeplerOrbit.
+            forward (bool): Search forward in time if True, else backward.
+        """
+        E = 2 * np.arctan2(np.sqrt(1 - e) * np.sin(np.multiply(f, 0.5)), np.sqrt(1 + e) * np.cos(np.multiply(f, 0.5)))
+        target = E - e * np.sin(E) # Kepler's equation gives the mean anomaly at f
+        current = 2 * np.pi * np.asarray(t, dtype=float) / T + M
+        if forward:
+            return t + np.mod(target - current, 2 * np.pi) * T / (2 * np.pi)
+        return t - np.mod(current - target, 2 * np.pi) * T / (2 * np.pi)
+
     def _getSpeed(self):
         return math.sqrt(self.my * (2 / self.r - 1 / self.a))
 
     def _getEccentricAnomaly(self, M):
         """Return eccentric anomly given mean anomaly M and the eccentricity e."""
-        prevE = M
-        iterations = 0
-        while (True):
-            E = M + self.e * math.sin(prevE)
-            if (math.isclose(E, prevE, abs_tol=KeplerOrbit._accuracy) or iterations > KeplerOrbit._maxIterations):
-                return E
-            prevE = E
+        if self.stepping:
+            E, self.residual, self.iterations, self._stepState = self.solver.step(M, self.e, self._stepState)
+        else:
+            E, self.residual, self.iterations = self.solver.solve(M, self.e)
+            self._stepState = None
+        return E
+
+    def _getEccentricAnomalies(self, M):
+        """Return eccentric anomalies given an array of mean anomalies M."""
+        return self.solver.solveArray(M, self.e)[0]
 
     def _getTrueAnomaly(self, E):
         """Return the true anomaly given the eccentric anomaly E."""
@@ -89,36 +237,25 @@ class KeplerOrbit:
 
 
 if __name__ == "__main__":
-    # Demo: Calculate aphelion and perihelion distances and plot the orbit for Earth.
+    # Demo: Calculate aphelion and perihelion for Earth and plot the orbit.
     import matplotlib.pyplot as plt
+    import simclock
     orbit = KeplerOrbit()
 
-    # Loop through orbit and sample coordinates every 6th hour.
-    # Save closest and farthest distance from the sun and speed at those points.
-    minDistance, maxDistance = math.inf, 0
-    coordinates = list()
-    time = orbit.epoch
-    orbitCompleteTime = time + datetime.timedelta(seconds=orbit.T)
-    perihelionSpeed, aphelionSpeed = 0, 0
-    while time < orbitCompleteTime:
-        time += datetime.timedelta(hours=6)
-        orbit.updatePosition(time)
-        tmpMin, tmpMax = minDistance, maxDistance
-        minDistance = min(orbit.r, minDistance)
-        maxDistance = max(orbit.r, maxDistance)
-        if minDistance != tmpMin:
-            perihelionSpeed = orbit.v
-        elif maxDistance != tmpMax:
-            aphelionSpeed = orbit.v
-        coordinates.append(orbit.getCartesianPosition())
+    # Times of the next apsides follow directly from the mean motion.
+    # Distance and speed there from the orbital elements and vis-viva.
+    perihelionTime, aphelionTime = orbit.getPeriapsisTime(), orbit.getApoapsisTime()
+    minDistance, maxDistance = orbit.a * (1 - orbit.e), orbit.a * (1 + orbit.e)
+    perihelionSpeed = math.sqrt(orbit.my * (2 / minDistance - 1 / orbit.a))
+    aphelionSpeed = math.sqrt(orbit.my * (2 / maxDistance - 1 / orbit.a))
 
     # Print apsis info
-    print(f"Perihelion - Speed: {round(perihelionSpeed / 1000, 3):.3f} km/s, Distance: {(minDistance / 1000):.4e} km")
-    print(f"Aphelion - Speed: {round(aphelionSpeed / 1000, 3):.3f} km/s, Distance: {(maxDistance / 1000):.4e} km")
-    
-    # Plot orbit
-    x, y = zip(*coordinates)
-    plt.plot(x, y)
+    print(f"Perihelion {simclock.formatTime(perihelionTime)} - Speed: {round(perihelionSpeed / 1000, 3):.3f} km/s, Distance: {(minDistance / 1000):.4e} km")
+    print(f"Aphelion {simclock.formatTime(aphelionTime)} - Speed: {round(aphelionSpeed / 1000, 3):.3f} km/s, Distance: {(maxDistance / 1000):.4e} km")
+
+    # Plot orbit, sampled every 6th hour
+    positions = orbit.getPositions(np.arange(0, orbit.T, 6 * 60 * 60))
+    plt.plot(positions.x, positions.y)
     plt.plot(0, 0, marker='o')
     plt.axis('equal')
     plt.title("Earth's orbit")
@@ -0,0 +1,350 @@
+"""keplersolver.py: Interchangeable solvers for Kepler's equation M = E - e * sin(E)."""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+import math
+import numpy as np
+
+class KeplerSolver:
+    """Base class for Kepler equation solvers.
+
+    A solver is given the mean anomaly M and eccentricity e and returns the eccentric anomaly E together with
+    the residual |E - e * sin(E) - M| and the number of iterations used. Iterative solvers stop when the last
+    correction is smaller than accuracy or when maxIterations corrections have been made, whichever comes first.
+    """
+
+    def __init__(self, accuracy=1e-10, maxIterations=20):
+        """Create a new KeplerSolver.
+
+        Args:
+            accuracy (float): Stop iterating when the correction of E is smaller than this, in radians.
+            maxIterations (int): Upper bound on the number of corrections per solve.
+        """
+        self.accuracy = accuracy
+        self.maxIterations = maxIterations
+
+    def prepare(self, e):
+        """Override this method to precompute data for orbits with eccentricity e."""
+        pass
+
+    def solve(self, M, e):
+        """Solve Kepler's equation for a single mean anomaly.
+
+        Args:
+            M (float): Mean anomaly in radians.
+            e (float): Eccentricity.
+
+        Returns:
+            (float, float, int): Eccentric anomaly, residual and number of iterations.
+        """
+        turns = math.floor((M + math.pi) / (2 * math.pi)) * 2 * math.pi
+        M -= turns
+        E = M + 0.85 * e * math.copysign(1, math.sin(M)) # Danby's starting value
+        iterations = 0
+        while iterations < self.maxIterations:
+            delta = self._correction(E, M, e, math.sin(E), math.cos(E))
+            E += delta
+            iterations += 1
+            if abs(delta) < self.accuracy:
+                break
+        return E + turns, abs(E - e * math.sin(E) - M), iterations
+
+    def solveArray(self, M, e):
+        """Solve Kepler's equation for an array of mean anomalies.
+
+        Args:
+            M (numpy.ndarray): Mean anomalies in radians.
+            e (float or numpy.ndarray): Eccentricity, or eccentricities broadcastable against M.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray, int): Eccentric anomalies, residuals and number of iterations.
+        """
+        turns = np.floor((M + math.pi) / (2 * math.pi)) * 2 * math.pi
+        M = M - turns
+        E = M + 0.85 * e * np.sign(np.sin(M))
+        iterations = 0
+        while iterations < self.maxIterations:
+            delta = self._correction(E, M, e, np.sin(E), np.cos(E))
+            E = E + delta
+            iterations += 1
+            if np.all(np.abs(delta) < self.accuracy):
+                break
+        return E + turns, np.abs(E - e * np.sin(E) - M), iterations
+
+    def step(self, M, e, state=None, maxStep=0.5):
+        """Solve Kepler's equation warm-started from the solution at a slightly smaller mean anomaly.
+
+        The previous solution is advanced to second order in the change of M and refined with one or two Newton
+        corrections. A correction delta leaves an error of at most e * delta^2 / (2 * (1 - e)), and iteration stops
+        when that is below accuracy. If there is no previous solution, M is before it or more than maxStep ahead,
+        or two corrections are not enough, solve() is used instead.
+
+        Args:
+            M (float): Mean anomaly in radians.
+            e (float): Eccentricity.
+            state (tuple): The state returned by the previous call, or None.
+            maxStep (float): Largest change of M in radians that is solved incrementally.
+
+        Returns:
+            (float, float, int, tuple): Eccentric anomaly, residual, number of iterations and the state to pass to
+                the next call.
+        """
+        if state != None and 0 <= M - state[0] <= maxStep:
+            M0, E0, sinE0, cosE0 = state
+            if sinE0 == None:
+                sinE0, cosE0 = math.sin(E0), math.cos(E0)
+            f1 = 1 - e * cosE0
+            d = (M - M0) / f1
+            E = E0 + d - e * sinE0 * d * d / (2 * f1)
+            for iterations in (1, 2):
+                delta = -(E - e * math.sin(E) - M) / (1 - e * math.cos(E))
+                E += delta
+                if e * delta * delta < 2 * (1 - e) * self.accuracy:
+                    sinE, cosE = math.sin(E), math.cos(E)
+                    return E, abs(E - e * sinE - M), iterations, (M, E, sinE, cosE)
+        E, residual, iterations = self.solve(M, e)
+        return E, residual, iterations, (M, E, None, None)
+
+    def stepArray(self, M, e, state=None, maxStep=0.5):
+        """Solve Kepler's equation for an array of mean anomalies warm-started from the previous call, see step().
+
+        Elements where step() would fall back to solve() are solved together with solveArray(). The state must
+        come from a call with arrays of the same shape.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray, int, tuple): Eccentric anomalies, residuals, number of iterations and the
+                state to pass to the next call. The state also holds sin(E) and cos(E), unless all elements fell
+                back to solveArray().
+        """
+        if state == None or np.shape(state[0]) != np.shape(M):
+            E, residual, iterations = self.solveArray(M, e)
+            return E, residual, iterations, (M, E, None, None)
+        M0, E0, sinE0, cosE0 = state
+        dM = M - M0
+        failed = (dM < 0) | (dM > maxStep)
+        if np.all(failed):
+            E, residual, iterations = self.solveArray(M, e)
+            return E, residual, iterations, (M, E, None, None)
+        if sinE0 is None:
+            sinE0, cosE0 = np.sin(E0), np.cos(E0)
+        f1 = 1 - e * cosE0
+        d = dM / f1
+        E = E0 + d - e * sinE0 * d * d / (2 * f1) # Second order Taylor expansion of E(M) at M0
+        delta = -(E - e * np.sin(E) - M) / (1 - e * np.cos(E))
+        E = E + delta
+        failed |= ~(e * delta * delta < 2 * (1 - e) * self.accuracy)
+        iterations = 1
+        if np.any(failed):
+            # Second correction for the elements that need it, then a full solve for those still not converged
+            iterations = 2
+            indices = np.flatnonzero(failed)
+            Ei, Mi, ei = E[indices], M[indices], e[indices] if np.ndim(e) > 0 else e
+            delta = -(Ei - ei * np.sin(Ei) - Mi) / (1 - ei * np.cos(Ei))
+            E[indices] = Ei + delta
+            indices = indices[(dM[indices] < 0) | (dM[indices] > maxStep) | ~(ei * delta * delta < 2 * (1 - ei) * self.accuracy)]
+            if len(indices) > 0:
+                E[indices], _, solved = self.solveArray(M[indices], e[indices] if np.ndim(e) > 0 else e)
+                iterations = max(iterations, solved)
+        sinE, cosE = np.sin(E), np.cos(E)
+        return E, np.abs(E - e * sinE - M), iterations, (M, E, sinE, cosE)
+
+    def _correction(self, E, M, e, sinE, cosE):
+        """Override this method to return the correction to add to E."""
+        raise NotImplementedError
+
+
+class NewtonSolver(KeplerSolver):
+    """Solve Kepler's equation with Newton-Raphson iteration. Converges quadratically."""
+
+    def _correction(self, E, M, e, sinE, cosE):
+        return -(E - e * sinE - M) / (1 - e * cosE)
+
+
+class HalleySolver(KeplerSolver):
+    """Solve Kepler's equation with Halley's method. Converges cubically at the cost of one extra term per iteration."""
+
+    def _correction(self, E, M, e, sinE, cosE):
+        f0 = E - e * sinE - M
+        f1 = 1 - e * cosE
+        f2 = e * sinE
+        return -f0 / (f1 - f0 * f2 / (2 * f1))
+
+
+class MarkleySolver(KeplerSolver):
+    """Solve Kepler's equation with Markley's cubic starter followed by a single fifth order correction.
+
+    The solver is not iterative: every call costs the same and reports one iteration. The error is close to
+    machine precision for all elliptic orbits (Markley, 1995, Celestial Mechanics and Dynamical Astronomy 63).
+    """
+
+    def __init__(self):
+        """Create a new MarkleySolver."""
+        super().__init__(maxIterations=1)
+
+    def solve(self, M, e):
+        turns = math.floor((M + math.pi) / (2 * math.pi)) * 2 * math.pi
+        M -= turns
+        E = self._markley(M, e, abs(M), math.sqrt, math.sin, math.cos)
+        return E + turns, abs(E - e * math.sin(E) - M), 1
+
+    def solveArray(self, M, e):
+        turns = np.floor((M + math.pi) / (2 * math.pi)) * 2 * math.pi
+        M = M - turns
+        E = self._markley(M, e, np.abs(M), np.sqrt, np.sin, np.cos)
+        return E + turns, np.abs(E - e * np.sin(E) - M), 1
+
+    @staticmethod
+    def _markley(M, e, absM, sqrt, sin, cos):
+        """Return E for M in [-pi, pi) using the given math functions, so that scalars and arrays share the code."""
+        pi2 = math.pi ** 2
+        alpha = (3 * pi2 + 1.6 * math.pi * (math.pi - absM) / (1 + e)) / (pi2 - 6)
+        d = 3 * (1 - e) + alpha * e
+        q = 2 * alpha * d * (1 - e) - M * M
+        r = 3 * alpha * d * (d - 1 + e) * M + M * M * M
+        w = (abs(r) + sqrt(q * q * q + r * r)) ** (2 / 3)
+        E = (2 * r * w / (w * w + w * q + q * q) + M) / d
+        # Fifth order correction
+        f2 = e * sin(E)
+        f3 = e * cos(E)
+        f0 = E - f2 - M
+        f1 = 1 - f3
+        d3 = -f0 / (f1 - f0 * f2 / (2 * f1))
+        d4 = -f0 / (f1 + d3 * f2 / 2 + d3 * d3 * f3 / 6)
+        d5 = -f0 / (f1 + d4 * f2 / 2 + d4 * d4 * f3 / 6 - d4 * d4 * d4 * f2 / 24)
+        return E + d5
+
+
+class TableSolver(KeplerSolver):
+    """Look up E in one table over eccentricity and mean anomaly and interpolate bilinearly between table entries.
+
+    Every solve costs the same regardless of eccentricity, and the table has the same size however many distinct
+    eccentricities are solved. The table covers mean anomalies from 0 to pi, using E(-M) = -E(M), and
+    eccentricities from 0 to a top value that is raised in coarse steps when a larger eccentricity is prepared, so
+    orbits added one by one only cause a few rebuilds. The spacing is chosen so that the interpolation error is
+    below maxError, using the bounds |d2E/dM2| <= e / (1 - e)^3 and |d2E/de2| <= (2 + e) / (1 - e)^3. Where that
+    would need more than maxSize entries, the table is made accurate up to a lower eccentricity, and only solves
+    for eccentricities above it refine the interpolated value with Newton iterations until the correction is
+    below maxError, which usually takes one or two iterations.
+    """
+
+    def __init__(self, maxError=1e-6, maxSize=1 << 20, maxIterations=10):
+        """Create a new TableSolver.
+
+        Args:
+            maxError (float): Upper bound on the error in E in radians.
+            maxSize (int): Upper bound on the number of entries in the table.
+            maxIterations (int): Upper bound on the number of Newton iterations above the exact part of the table.
+        """
+        super().__init__(accuracy=maxError, maxIterations=maxIterations)
+        self.maxSize = maxSize
+        self.exactLimit = 0.0
+        self._top = 0.0
+        self._pending = False
+        self._columns, self._rows = 1, 1
+        self._correct = np.zeros(1, dtype=bool)
+        self._table = np.zeros(4)
+
+    def prepare(self, e):
+        """Make sure that the table covers eccentricity e. The table is rebuilt on the next solve if it does not."""
+        if e > self._top or self._top == 0:
+            # Raise the top in steps of 1/8, then halve the distance to 1, to bound the number of rebuilds
+            self._top = max(1, math.ceil(e * 8)) / 8 if e < 0.875 else 1 - 2.0**math.floor(math.log2(1 - e))
+            self._pending = True
+
+    def solve(self, M, e):
+        self.prepare(e)
+        if self._pending:
+            self._build()
+        turns = math.floor((M + math.pi) / (2 * math.pi)) * 2 * math.pi
+        M -= turns
+        x = abs(M) * self._columns / math.pi
+        i = min(int(x), self._columns - 1)
+        y = e * self._rows / self._top
+        j = min(int(y), self._rows - 1)
+        index = j * (self._columns + 1) + i
+        table, fx, fy = self._table, x - i, y - j
+        low = table[index] + fx * (table[index + 1] - table[index])
+        high = table[index + self._columns + 1] + fx * (table[index + self._columns + 2] - table[index + self._columns + 1])
+        E = math.copysign(low + fy * (high - low), M)
+        iterations = 0
+        while self._correct[j] and iterations < self.maxIterations:
+            delta = -(E - e * math.sin(E) - M) / (1 - e * math.cos(E))
+            E += delta
+            iterations += 1
+            if abs(delta) < self.accuracy:
+                break
+        return E + turns, abs(E - e * math.sin(E) - M), iterations
+
+    def step(self, M, e, state=None, maxStep=0.5):
+        """Solve with a table lookup, which already costs the same as a warm-started step. See KeplerSolver.step()."""
+        E, residual, iterations = self.solve(M, e)
+        return E, residual, iterations, (M, E, None, None)
+
+    def stepArray(self, M, e, state=None, maxStep=0.5):
+        """Solve with table lookups, which already cost the same as warm-started steps. See KeplerSolver.stepArray()."""
+        E, residual, iterations = self.solveArray(M, e)
+        return E, residual, iterations, (M, E, None, None)
+
+    def solveArray(self, M, e):
+        self.prepare(float(np.max(e)) if np.size(e) > 0 else 0.0)
+        if self._pending:
+            self._build()
+        M, e = np.broadcast_arrays(np.asarray(M, dtype=float), np.asarray(e, dtype=float))
+        turns = np.floor((M + math.pi) / (2 * math.pi)) * 2 * math.pi
+        M = M - turns
+        x = np.abs(M) * self._columns / math.pi
+        i = np.minimum(x.astype(int), self._columns - 1)
+        y = e * self._rows / self._top
+        j = np.minimum(y.astype(int), self._rows - 1)
+        index = j * (self._columns + 1) + i
+        table, fx, fy = self._table, x - i, y - j
+        low = table[index] + fx * (table[index + 1] - table[index])
+        high = table[index + self._columns + 1] + fx * (table[index + self._columns + 2] - table[index + self._columns + 1])
+        E = np.copysign(low + fy * (high - low), M)
+        iterations = 0
+        correct = np.flatnonzero(self._correct[j])
+        if len(correct) > 0:
+            Ec, Mc, ec = E[correct], M[correct], e[correct]
+            while iterations < self.maxIterations:
+                delta = -(Ec - ec * np.sin(Ec) - Mc) / (1 - ec * np.cos(Ec))
+                Ec = Ec + delta
+                iterations += 1
+                if np.all(np.abs(delta) < self.accuracy):
+                    break
+            E[correct] = Ec
+        return E + turns, np.abs(E - e * np.sin(E) - M), iterations
+
+    def _build(self):
+        """Choose the table spacing for the current top eccentricity and compute the table."""
+        self._pending = False
+        low, high = 0.0, self._top
+        if self._layout(high)[2] > self.maxSize:
+            for _ in range(30): # Bisect for the highest eccentricity the table can be exact to
+                middle = (low + high) / 2
+                low, high = (middle, high) if self._layout(middle)[2] <= self.maxSize else (low, middle)
+        else:
+            low = high
+        self.exactLimit = low
+        self._columns, self._rows, _ = self._layout(low)
+        self._correct = (np.arange(1, self._rows + 1) * self._top / self._rows) > self.exactLimit # Rows above the exact part
+        M = np.linspace(0, math.pi, self._columns + 1)
+        e = np.linspace(0, self._top, self._rows + 1)
+        self._table = MarkleySolver().solveArray(M[np.newaxis, :], e[:, np.newaxis])[0].ravel()
+
+    def _layout(self, e):
+        """Return columns, rows and entries of a table that is within maxError up to eccentricity e.
+
+        Each direction gets half of the error budget, and the interpolation error of a spacing h is h^2 / 8 times
+        the bound on the second derivative.
+        """
+        e = max(e, 1e-3) # Coarsest useful table
+        columns = max(1, math.ceil(math.pi / math.sqrt(4 * self.accuracy * (1 - e)**3 / e)))
+        rows = max(1, math.ceil(self._top / math.sqrt(4 * self.accuracy * (1 - e)**3 / (2 + e))))
+        return columns, rows, (columns + 1) * (rows + 1)
+
+
+if __name__ == "__main__":
+    print("Warning: keplersolver.py is not intended to run stand-alone.")
@@ -5,8 +5,15 @@ __copyright__ = "Copyright 2020, Andreas Andersson"
 __contact__ = "andreas.andersson@tutanota.com"
 
 
+from lrucache import LRUCache
+
 class Label:
-    """Renders and positions a text label in a PyGame app."""
+    """Renders and positions a text label in a PyGame app.
+
+    Class members:
+        renderCache (LRUCache): Rendered text surfaces shared by all labels, keyed by font, text and color.
+    """
+    renderCache = LRUCache(256)
 
     def __init__(self, font, color, text="", top=0, left=0, bottom=None, right=None):
         """Create a new Label. Positions will not be set until updatePosition() is called.
@@ -27,12 +34,28 @@ class Label:
         self.left = left
         self.bottom = bottom
         self.right = right
+        self._renderKey = None
         self.renderLabel()
 
     def renderLabel(self):
-        """Render label from string."""
-        self.render = self.font.render(self.text, True, self.color)
+        """Render label from string. Nothing is done if text, font and color are unchanged since last time.
+
+        Returns:
+            bool: True if the label was rendered, which also resets rect. False otherwise.
+        """
+        key = (self.font, self.text, self.color)
+        if key == self._renderKey:
+            return False
+        self._renderKey = key
+        self.render = Label.renderCache.get(key, Label._render)
         self.rect = self.render.get_rect()
+        return True
+
+    @staticmethod
+    def _render(key):
+        """Render text surface for a (font, text, color) key."""
+        font, text, color = key
+        return font.render(text, True, color)
 
     def udpatePosition(self, screenSize):
         """Update on-screen label position.
@@ -0,0 +1,58 @@
+"""lrucache.py: A bounded cache that evicts the least recently used entry."""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+from collections import OrderedDict
+
+class LRUCache:
+    """Map keys to values, keeping at most maxSize entries."""
+
+    def __init__(self, maxSize=128):
+        """Create a new LRUCache.
+
+        Args:
+            maxSize (int): Maximum number of entries. The least recently used entry is dropped when exceeded.
+        """
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, create):
+        """Return the value for key. If key is not in the cache, the value is created by calling create(key).
+
+        Args:
+            key (hashable): The key to look up.
+            create (callable): Function taking key and returning the value to cache.
+        """
+        try:
+            value = self._entries[key]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+        except KeyError:
+            self.misses += 1
+        value = create(key)
+        self._entries[key] = value
+        if len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Remove all entries."""
+        self._entries.clear()
+
+    def __len__(self):
+        """Return the number of cached entries."""
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Return True if key is cached, without marking it as used."""
+        return key in self._entries
+
+
+if __name__ == "__main__":
+    print("Warning: lrucache.py is not intended to run stand-alone.")
@@ -5,22 +5,44 @@ __copyright__ = "Copyright 2020, Andreas Andersson"
 __contact__ = "andreas.andersson@tutanota.com"
 
 
+import argparse
 import pygame
 from solarsystem import SolarSystem
+from catalogue import Catalogue
+
+# Command line
+parser = argparse.ArgumentParser(description="Animate the orbits of the solar system.")
+parser.add_argument("--ephemeris", help="precomputed npy or col ephemeris to read planet positions from, see ephemeris.py")
+parser.add_argument("--bodies", help="JSON, CSV or MPCORB element file of minor bodies to show, see catalogue.py")
+parser.add_argument("--band", choices=[band[0] for band in Catalogue.BANDS], help="only show minor bodies in this orbital band")
+parser.add_argument("--max-fps", type=int, default=60, help="upper bound on frames per second, 0 for none (default: 60)")
+parser.add_argument("--profile", metavar="FILE", help="write per-frame stage timings in ms to a CSV file")
+args = parser.parse_args()
 
 # Init game
 pygame.init()
 clock = pygame.time.Clock()
-solarSystem = SolarSystem()
+solarSystem = SolarSystem(ephemeris=args.ephemeris, bodies=args.bodies, band=args.band)
 pygame.display.set_caption("Our Solar System")
+solarSystem.maxFps = args.max_fps
+profiler = solarSystem.profiler
+if args.profile != None:
+    profiler.enabled = True
+    profiler.openLog(args.profile)
 
 # Game loop
 while solarSystem.isAlive:
-    for event in pygame.event.get():
-        solarSystem.eventHandler(event)
+    with profiler.stage("frame"):
+        with profiler.stage("events"):
+            for event in pygame.event.get():
+                solarSystem.eventHandler(event)
 
-    solarSystem.update()
-    pygame.display.flip()
-    clock.tick(solarSystem.fps)
+        dirty = solarSystem.update()
+        with profiler.stage("display"):
+            if len(dirty) > 0:
+                pygame.display.update(dirty)
+    profiler.endFrame()
+    clock.tick(solarSystem.maxFps)
 
+profiler.closeLog()
 pygame.quit()
\ No newline at end of file
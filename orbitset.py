@@ -0,0 +1,215 @@
+"""orbitset.py: Propagate many Kepler orbits at once."""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+import math
+import types
+import numpy as np
+import simclock
+from keplerorbit import KeplerOrbit
+
+class OrbitSet:
+    """Keep the elements of many KeplerOrbits in contiguous arrays and solve them all in one pass.
+
+    Members:
+        orbits (list of KeplerOrbit): The orbits added with add(), in the order they were added.
+        epoch (datetime.datetime): Reference time shared by all orbits in the set.
+        t (float): Time in seconds since epoch of the latest call to updatePositions().
+        E, f, r, v, x, y (numpy.ndarray): Eccentric anomaly, true anomaly, distance, speed and cartesian position
+            of each orbit at t.
+        solver (KeplerSolver): Solver for Kepler's equation, used on all orbits at once.
+        stepping (bool): If True, updatePositions() starts from the previous eccentric anomalies when time moves
+            forward by a small step, see KeplerSolver.stepArray(). Pays off for large sets with an iterative
+            solver; for a handful of orbits the extra array operations cost more than they save. Default is False.
+    """
+    _elements = ("e", "a", "T", "O", "o", "M", "my", "i")
+
+    def __init__(self, *orbits, solver=None):
+        """Create a new OrbitSet.
+
+        Args:
+            orbits (KeplerOrbit): Orbits to add to the set.
+            solver (KeplerSolver): Solver for Kepler's equation. Default is KeplerOrbit.defaultSolver.
+        """
+        self.solver = solver if solver != None else KeplerOrbit.defaultSolver
+        self.orbits = []
+        self.epoch = None
+        for name in OrbitSet._elements:
+            setattr(self, name, np.empty(0))
+        self.t = 0.0
+        self.stepping = False
+        self.ephemeris, self.ephemerisBodies = None, None
+        self._stepState = None
+        self.updatePositions(self.t)
+        self.add(*orbits)
+
+    def add(self, *orbits):
+        """Append orbits to the set.
+
+        Args:
+            orbits (KeplerOrbit): Orbits to add. All orbits in a set must share the same epoch.
+
+        Raises:
+            ValueError: If an orbit has a different epoch than the orbits already in the set.
+        """
+        if len(orbits) == 0:
+            return
+        for orbit in orbits:
+            if orbit.epoch != (self.epoch if self.epoch != None else orbits[0].epoch):
+                raise ValueError("All orbits in an OrbitSet must share the same epoch.")
+        e, a, T, O, o, M, my, i = (np.array([getattr(orbit, name) for orbit in orbits], dtype=float) for name in OrbitSet._elements)
+        self.addElements(e, a, T, O, o, M, my, orbits[0].epoch, i)
+        self.orbits.extend(orbits)
+
+    def addElements(self, e, a, T, O, o, M, my=1.327124400189e20, epoch=simclock.J2000, i=0.0):
+        """Append orbits given as arrays of elements, without creating KeplerOrbit objects. See KeplerOrbit for units.
+
+        Raises:
+            ValueError: If epoch differs from the epoch of the orbits already in the set.
+        """
+        if self.epoch == None:
+            self.epoch = epoch
+        elif epoch != self.epoch:
+            raise ValueError("All orbits in an OrbitSet must share the same epoch.")
+        e = np.asarray(e, dtype=float)
+        for value in np.unique(e):
+            self.solver.prepare(float(value))
+        for name, values in zip(OrbitSet._elements, (e, a, T, O, o, M, my, i)):
+            values = np.broadcast_to(np.asarray(values, dtype=float), e.shape)
+            setattr(self, name, np.concatenate((getattr(self, name), values)))
+        self.ephemeris, self.ephemerisBodies = None, None
+        self._stepState = None
+        self.updatePositions(self.t)
+
+    def truncate(self, length):
+        """Remove all orbits after the first length orbits. Detaches the ephemeris like addElements()."""
+        for name in OrbitSet._elements:
+            setattr(self, name, getattr(self, name)[:length])
+        del self.orbits[length:]
+        self.ephemeris, self.ephemerisBodies = None, None
+        self._stepState = None
+        self.updatePositions(self.t)
+
+    def __len__(self):
+        """Return the number of orbits in the set."""
+        return len(self.e)
+
+    def attachEphemeris(self, ephemeris, bodies):
+        """Read positions from a precomputed ephemeris instead of solving Kepler's equation when possible.
+
+        The ephemeris is detached when orbits are added to the set.
+
+        Args:
+            ephemeris (EphemerisTable): Table with samples for all orbits in the set, or None to detach.
+            bodies (slice or list of int): The table index of each orbit in the set.
+        """
+        self.ephemeris, self.ephemerisBodies = ephemeris, bodies
+
+    def updatePositions(self, t):
+        """Update the position of every orbit in the set. Interpolates in the attached ephemeris if it covers t.
+
+        Args:
+            t (float): Time in seconds since epoch.
+        """
+        self.t = t
+        if self.ephemeris != None and self.ephemeris.contains(t):
+            positions = self.ephemeris.interpolate(t, self.ephemerisBodies)
+            positions.f = np.arctan2(positions.y, positions.x) - self.O - self.o
+            positions.v = np.sqrt(self.my * (2 / positions.r - 1 / self.a)) # Speed from vis-viva, as when solving
+            positions.E = 2 * np.arctan(np.sqrt((1 - self.e) / (1 + self.e)) * np.tan(positions.f / 2))
+            self._stepState = None
+        elif self.stepping:
+            positions = self._propagate(self.solver, t, self.e, self.a, self.T, self.O, self.o, self.M, self.my, stepping=True, stepState=self._stepState)
+            self._stepState = positions.stepState
+        else:
+            positions = self._propagate(self.solver, t, self.e, self.a, self.T, self.O, self.o, self.M, self.my)
+        self.E, self.f, self.r, self.v, self.x, self.y = positions.E, positions.f, positions.r, positions.v, positions.x, positions.y
+
+    def getStateVectors(self, dimensions=2):
+        """Return position and velocity of every orbit at the time of the latest updatePositions(), without solving again.
+
+        Args:
+            dimensions (int): 2 for the plane of each orbit, 3 to also tilt the orbits by their inclinations.
+
+        Returns:
+            SimpleNamespace: Arrays x, y (and z) in m and vx, vy (and vz) in m/s, see KeplerOrbit.stateVectors().
+        """
+        return KeplerOrbit.stateVectors(self.E, self.e, self.a, self.T, self.O, self.o, self.i if dimensions == 3 else None)
+
+    def getPositions(self, t, velocity=False, dimensions=2):
+        """Return positions of every orbit for many points in time without changing the state of the set.
+
+        Args:
+            t (numpy.ndarray): One dimensional array of times in seconds since epoch.
+            velocity (bool): Also return the velocity components vx and vy (and vz) in m/s if True.
+            dimensions (int): 2 for the plane of each orbit, 3 to also tilt the orbits by their inclinations and
+                return z.
+
+        Returns:
+            SimpleNamespace: Arrays f, r, v, x, y, z and velocities as requested, shaped (number of orbits, number
+                of times).
+        """
+        t = np.asarray(t, dtype=float)
+        e, a, T, O, o, M, my, i = (getattr(self, name)[:, np.newaxis] for name in OrbitSet._elements)
+        return self._propagate(self.solver, t, e, a, T, O, o, M, my, velocity, i=i if dimensions == 3 else None)
+
+    def getTimeOfTrueAnomaly(self, f, t=0.0, forward=True):
+        """Return when each orbit has true anomaly f, without solving Kepler's equation. See KeplerOrbit.getTimeOfTrueAnomaly().
+
+        Args:
+            f (float or numpy.ndarray): True anomaly in radians, for all orbits or one per orbit.
+            t (float or numpy.ndarray): Time in seconds since epoch to search from, for all orbits or one per orbit.
+            forward (bool): Return the first time at or after t if True, else the last time at or before t.
+
+        Returns:
+            numpy.ndarray: Seconds since epoch for each orbit.
+        """
+        return KeplerOrbit.timeOfTrueAnomaly(f, t, self.e, self.T, self.M, forward)
+
+    def getPeriapsisTime(self, t=0.0, forward=True):
+        """Return the time of the next periapsis of each orbit at or after t, or the previous one if not forward."""
+        return self.getTimeOfTrueAnomaly(0.0, t, forward)
+
+    def getApoapsisTime(self, t=0.0, forward=True):
+        """Return the time of the next apoapsis of each orbit at or after t, or the previous one if not forward."""
+        return self.getTimeOfTrueAnomaly(math.pi, t, forward)
+
+    def getNodeTime(self, t=0.0, ascending=True, forward=True):
+        """Return the time of the next ascending or descending node of each orbit, see KeplerOrbit.getNodeTime()."""
+        return self.getTimeOfTrueAnomaly(-self.o if ascending else math.pi - self.o, t, forward)
+
+    @staticmethod
+    def _propagate(solver, t, e, a, T, O, o, M, my, velocity=False, stepping=False, stepState=None, i=None):
+        """Solve Kepler's equation for broadcastable arrays of elements and times.
+
+        If stepping, the solve is warm-started from stepState with KeplerSolver.stepArray() and the returned
+        positions also hold the state for the next step as stepState. If i is given, x and y are replaced
+        by the three dimensional position x, y and z.
+        """
+        M = 2 * math.pi * t / T + M
+        if stepping:
+            E, _, _, stepState = solver.stepArray(M, e, stepState)
+            cosE = stepState[3] if stepState[3] is not None else np.cos(E)
+        else:
+            E = solver.solveArray(M, e)[0]
+            cosE = np.cos(E)
+        f = 2 * np.arctan(np.sqrt((1 + e) / (1 - e)) * np.tan(E / 2))
+        r = a * (1 - e * cosE)
+        v = np.sqrt(my * (2 / r - 1 / a))
+        positions = types.SimpleNamespace(E=E, f=f, r=r, v=v, stepState=stepState)
+        if i is None and not velocity:
+            phi = f + O + o
+            positions.x, positions.y = r * np.cos(phi), r * np.sin(phi)
+        else:
+            state = KeplerOrbit.stateVectors(E, e, a, T, O, o, i)
+            for name, value in vars(state).items():
+                if velocity or not name.startswith("v"):
+                    setattr(positions, name, value)
+        return positions
+
+
+if __name__ == "__main__":
+    print("Warning: orbitset.py is not intended to run stand-alone.")
@@ -0,0 +1,130 @@
+"""profiler.py: Measure where the time of each frame goes."""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+import time
+from collections import deque
+import numpy as np
+
+class FrameProfiler:
+    """Collect the time spent in named stages of each frame and keep rolling statistics.
+
+    Wrap each stage in a with statement on stage(). A stage entered more than once in a frame adds up, and a
+    stage that is not entered in a frame counts as zero for that frame. Call endFrame() once per frame to store
+    the frame in the rolling window and, if a log is open, write it there.
+    While disabled, stage() returns a shared no-op context and nothing is recorded.
+
+    Members:
+        enabled (bool): Record timings if True.
+        window (int): Number of frames the statistics are computed over.
+        frames (int): Number of frames recorded since creation.
+    """
+
+    def __init__(self, window=300, enabled=False):
+        """Create a new FrameProfiler.
+
+        Args:
+            window (int): Number of frames the statistics are computed over.
+            enabled (bool): Record timings if True.
+        """
+        self.enabled = enabled
+        self.window = window
+        self.frames = 0
+        self._history = dict()
+        self._current = dict()
+        self._log = None
+        self._noop = _NoopStage()
+
+    def stage(self, name):
+        """Return a context manager that adds the time spent inside it to stage name of the current frame."""
+        if not self.enabled:
+            return self._noop
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        """Add seconds to stage name of the current frame."""
+        self._current[name] = self._current.get(name, 0.0) + seconds
+
+    def endFrame(self):
+        """Store the timings of the current frame and start a new one."""
+        if not self.enabled:
+            return
+        for name in self._current:
+            if name not in self._history:
+                self._history[name] = deque(maxlen=self.window)
+        for name, history in self._history.items():
+            history.append(self._current.get(name, 0.0)) # Stages skipped in this frame count as zero
+        if self._log != None:
+            self._log.writelines(f"{self.frames},{name},{seconds * 1000:.4f}\n" for name, seconds in self._current.items())
+        self._current = dict()
+        self.frames += 1
+
+    def stages(self):
+        """Return the names of all stages recorded so far, in the order they were first seen."""
+        return list(self._history)
+
+    def percentiles(self, name, q=(50, 95, 99)):
+        """Return percentiles of the time of stage name over the rolling window.
+
+        Args:
+            name (string): The stage.
+            q (tuple of float): Percentiles to compute, between 0 and 100.
+
+        Returns:
+            numpy.ndarray: The percentiles in ms, or NaN if the stage has not been recorded.
+        """
+        history = self._history.get(name)
+        if not history:
+            return np.full(len(q), np.nan)
+        return np.percentile(np.array(history) * 1000, q)
+
+    def openLog(self, path):
+        """Write the timings of every following frame to a CSV file with columns frame, stage and ms."""
+        self.closeLog()
+        self._log = open(path, "w")
+        self._log.write("frame,stage,ms\n")
+
+    @property
+    def logging(self):
+        """Return True if a log file is open."""
+        return self._log != None
+
+    def closeLog(self):
+        """Close the log file, if open."""
+        if self._log != None:
+            self._log.close()
+            self._log = None
+
+
+class _Stage:
+    """Context manager timing one stage for a FrameProfiler."""
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoopStage:
+    """Context manager that does nothing, used while profiling is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+if __name__ == "__main__":
+    print("Warning: profiler.py is not intended to run stand-alone.")
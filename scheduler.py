@@ -0,0 +1,56 @@
+"""scheduler.py: Advance simulation time by wall-clock time in fixed steps, independent of the frame rate."""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+import time
+
+class FixedStepScheduler:
+    """Turn elapsed wall-clock time into a whole number of fixed length simulation ticks.
+
+    Time left over after the last whole tick is carried to the next frame, so simulation time follows the wall
+    clock exactly over time whatever the frame rate is. A slow frame gives more ticks to the next frame instead
+    of slowing the simulation down. Since positions are computed directly from the time, catching up on many ticks
+    costs the same as one.
+
+    Members:
+        tickLength (float): Wall-clock seconds per tick.
+        fps (float): Smoothed number of frames per second, measured between calls to advance().
+    """
+
+    def __init__(self, tickLength=0.001, clock=time.perf_counter):
+        """Create a new FixedStepScheduler.
+
+        Args:
+            tickLength (float): Wall-clock seconds per tick.
+            clock (callable): Function returning wall-clock time in seconds.
+        """
+        self.tickLength = tickLength
+        self.fps = 0.0
+        self._clock = clock
+        self._last = None
+        self._remainder = 0.0
+
+    def advance(self):
+        """Return the number of ticks since the last call. The first call after creation or reset() returns 0."""
+        now = self._clock()
+        if self._last == None:
+            self._last = now
+            return 0
+        elapsed = now - self._last
+        self._last = now
+        if elapsed > 0:
+            self.fps = 1 / elapsed if self.fps == 0 else 0.9 * self.fps + 0.1 / elapsed
+        ticks, self._remainder = divmod(self._remainder + elapsed, self.tickLength)
+        return int(ticks)
+
+    def reset(self):
+        """Forget the time since the last call, e.g. after the game loop has been blocked by a dialog."""
+        self._last = None
+        self._remainder = 0.0
+
+
+if __name__ == "__main__":
+    print("Warning: scheduler.py is not intended to run stand-alone.")
@@ -6,21 +6,39 @@ __contact__ = "andreas.andersson@tutanota.com"
 
 
 import math
+import numpy as np
+from lrucache import LRUCache
 
 class SciFormat:
-    """Pretty print in scientific notation with utf-8 superscript, e.g. 1.23x10⁻⁵."""
+    """Pretty print in scientific notation with utf-8 superscript, e.g. 1.23x10⁻⁵.
+
+    Class members:
+        compiledCache (LRUCache): Formatters for recently used format strings, see compile().
+    """
 
     superscriptMap = {"0": "⁰", "1": "¹", "2": "²", "3": "³", "4": "⁴", "5": "⁵", "6": "⁶", "7": "⁷", "8": "⁸", "9": "⁹", "-": "⁻"}
+    compiledCache = LRUCache(64)
 
     def __init__(self, num):
-        """Create a new SciFormat.
+        """Create a new SciFormat. Magnitude and base are computed when first used.
         
         Args:
             num (int or float): The number to format.
         """
         self.num = num
-        self.magnitude = math.floor(math.log10(num))
-        self.base = self.num / (10**self.magnitude)
+        self._magnitude = None
+
+    @property
+    def magnitude(self):
+        """Return the power of ten of num."""
+        if self._magnitude == None:
+            self._magnitude = math.floor(math.log10(self.num))
+        return self._magnitude
+
+    @property
+    def base(self):
+        """Return num divided by ten to the power of magnitude."""
+        return self.num / (10**self.magnitude)
 
     def __format__(self, format):
         """Return num as a string formatted according to given format string.
@@ -48,38 +66,90 @@ class SciFormat:
                     print(f"{n:4.2}")           -> 1.23x10⁻⁴
                     print(f"{n:5.5}")           -> 0.00012
         """
-        magLim = 0
-        precision = math.inf
-        fill = False
+        return SciFormat.compile(format)._format(self.num, self.magnitude, self.base)
+
+    @staticmethod
+    def compile(format):
+        """Return a SciFormatter for format string, see __format__(). Formatters are cached in compiledCache."""
+        return SciFormat.compiledCache.get(format, SciFormatter)
+
+
+class SciFormatter:
+    """A SciFormat format string parsed once, for formatting many numbers. Get one from SciFormat.compile().
+
+    Example:
+        formatter = SciFormat.compile(".2")
+        formatter.format(12345)                       -> 1.23x10⁴
+        formatter.formatMany(np.array([0.5, 2000]))   -> ['5.0x10⁻¹', '2.0x10³']
+    """
+
+    _exponents = dict() # Superscript exponent string by magnitude, shared by all formatters
+
+    def __init__(self, format):
+        """Create a new SciFormatter.
+
+        Args:
+            format (string): Format string given as '[magnitude limit][.[0]precision]', see SciFormat.__format__().
+        """
+        self.magLim = 0
+        self.precision = math.inf
+        self.fill = False
         fSplit = format.split('.')
         if (fSplit[0]) != '':
-            magLim = int(fSplit[0])
+            self.magLim = int(fSplit[0])
         if len(fSplit) == 2:
             pStr = fSplit[1]
             if pStr[0] == '0' and len(pStr) > 1:
-                fill = True
+                self.fill = True
                 pStr = pStr[1:]
-            precision = int(pStr)
-        result = ""
-        if abs(self.magnitude) < magLim:
-            num = self.num if precision == math.inf else round(self.num, precision)
+            self.precision = int(pStr)
+        self._pad = (2 if self.precision > 0 and self.fill else 0) + (self.precision if self.fill else 0)
+
+    def format(self, num):
+        """Return num as a string."""
+        magnitude = math.floor(math.log10(num))
+        return self._format(num, magnitude, num / (10**magnitude))
+
+    def formatMany(self, values):
+        """Return a list with every value in an array formatted as a string. Same result as format() on each value.
+
+        Args:
+            values (numpy.ndarray): One dimensional array of positive numbers.
+
+        Raises:
+            ValueError: If a value is zero, negative, infinite or NaN, like format() for such values.
+        """
+        values = np.asarray(values)
+        if len(values) == 0:
+            return []
+        if not np.all(np.isfinite(values) & (values > 0)):
+            raise ValueError("Only finite positive numbers can be formatted.")
+        magnitudes = np.floor(np.log10(values)).astype(np.int64)
+        low = int(magnitudes.min())
+        powers = np.array([float(10**magnitude) for magnitude in range(low, int(magnitudes.max()) + 1)]) # As in format()
+        bases = values / powers[magnitudes - low]
+        return [self._format(*item) for item in zip(values.tolist(), magnitudes.tolist(), bases.tolist())]
+
+    def _format(self, num, magnitude, base):
+        """Return num with given magnitude and base as a string."""
+        precision = self.precision
+        if abs(magnitude) < self.magLim:
+            num = num if precision == math.inf else round(num, precision)
             if precision == 0:
-                result = str(int(num))
-            elif fill:
+                return str(int(num))
+            elif self.fill:
                 result = str(num)
                 if not '.' in result:
                     result += '.'
-                result = result.ljust(self.magnitude + precision + 2, '0')
-            else:
-                result = str(num)
-        else:
-            base = round(self.base, precision) if precision != math.inf else self.base
-            if base.is_integer() and precision == 0:
-                base = int(base)
-            pad = (2 if precision > 0 and fill else 0) + (precision if fill else 0)
-            exp = "".join(map(lambda x: SciFormat.superscriptMap[x], str(self.magnitude)))
-            result = f"{str(base).ljust(pad, '0')}x10{exp}"
-        return result
+                return result.ljust(magnitude + precision + 2, '0')
+            return str(num)
+        base = round(base, precision) if precision != math.inf else base
+        if precision == 0 and base.is_integer():
+            base = int(base)
+        exp = SciFormatter._exponents.get(magnitude)
+        if exp == None:
+            exp = SciFormatter._exponents[magnitude] = "".join(SciFormat.superscriptMap[x] for x in str(magnitude))
+        return f"{str(base).ljust(self._pad, '0')}x10{exp}"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+"""simclock.py: Simulation time as float seconds since J2000 and conversion to and from calendar dates."""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+import math
+import re
+import datetime
+
+# Constants
+J2000 = datetime.datetime(2000, 1, 1, 12)
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+YEAR = 365.25 * DAY # Julian year
+MONTH = YEAR / 12
+_J2000_DAYS = 10957 # Days from 1970-01-01 to 2000-01-01
+_DATE_PATTERN = re.compile(r"^\s*([+-]?\d+)-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2})(?::(\d{1,2})(?::(\d{1,2}(?:\.\d*)?))?)?)?\s*$")
+
+
+def formatTime(seconds, showTime=True):
+    """Format simulation time as an ISO date in the proleptic Gregorian calendar. Works for any year.
+
+    Years before year 1 use astronomical numbering, i.e. year 0 is 1 BC and year -1 is 2 BC.
+
+    Args:
+        seconds (float): Seconds since J2000.
+        showTime (bool): Add time of day as HH:MM:SS if True.
+
+    Returns:
+        string: The date as yyyy-mm-dd or yyyy-mm-dd HH:MM:SS.
+    """
+    days, secs = divmod(math.floor(seconds) + 12 * HOUR, DAY)
+    year, month, day = _civilFromDays(days + _J2000_DAYS)
+    text = f"{year:04d}-{month:02d}-{day:02d}" if year >= 0 else f"-{-year:04d}-{month:02d}-{day:02d}"
+    if showTime:
+        text += f" {secs // HOUR:02d}:{secs % HOUR // MINUTE:02d}:{secs % MINUTE:02d}"
+    return text
+
+
+def parse(text):
+    """Parse a date given as yyyy-mm-dd [H[:M[:S]]]. The year may have any number of digits and a sign.
+
+    Args:
+        text (string): The date to parse.
+
+    Returns:
+        float: Seconds since J2000.
+
+    Raises:
+        ValueError: If the text is not a valid date.
+    """
+    match = _DATE_PATTERN.match(text)
+    if match == None:
+        raise ValueError(f"Invalid date: {text}")
+    year, month, day, hour, minute = (int(group) if group != None else 0 for group in match.groups()[:5])
+    second = float(match.group(6)) if match.group(6) != None else 0.0
+    if month < 1 or month > 12 or day < 1 or day > _daysInMonth(year, month) or hour > 23 or minute > 59 or second >= 60:
+        raise ValueError(f"Invalid date: {text}")
+    days = _daysFromCivil(year, month, day) - _J2000_DAYS
+    return days * DAY + hour * HOUR + minute * MINUTE + second - 12 * HOUR
+
+
+def _daysInMonth(year, month):
+    """Return the number of days in a month of the proleptic Gregorian calendar."""
+    if month == 2:
+        return 29 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 28
+    return 30 if month in (4, 6, 9, 11) else 31
+
+
+def _daysFromCivil(year, month, day):
+    """Return days since 1970-01-01 for a date in the proleptic Gregorian calendar (H. Hinnant's algorithm)."""
+    year -= month <= 2
+    era = year // 400
+    yearOfEra = year - era * 400
+    dayOfYear = (153 * (month - 3 if month > 2 else month + 9) + 2) // 5 + day - 1
+    dayOfEra = yearOfEra * 365 + yearOfEra // 4 - yearOfEra // 100 + dayOfYear
+    return era * 146097 + dayOfEra - 719468
+
+
+def _civilFromDays(days):
+    """Return (year, month, day) given days since 1970-01-01 (H. Hinnant's algorithm)."""
+    days += 719468
+    era = days // 146097
+    dayOfEra = days - era * 146097
+    yearOfEra = (dayOfEra - dayOfEra // 1460 + dayOfEra // 36524 - dayOfEra // 146096) // 365
+    dayOfYear = dayOfEra - (365 * yearOfEra + yearOfEra // 4 - yearOfEra // 100)
+    mp = (5 * dayOfYear + 2) // 153
+    day = dayOfYear - (153 * mp + 2) // 5 + 1
+    month = mp + 3 if mp < 10 else mp - 9
+    return yearOfEra + era * 400 + (month <= 2), month, day
+
+
+if __name__ == "__main__":
+    print("Warning: simclock.py is not intended to run stand-alone.")
@@ -5,12 +5,16 @@ __copyright__ = "Copyright 2020, Andreas Andersson"
 __contact__ = "andreas.andersson@tutanota.com"
 
 
-import pygame, math, datetime
-from keplerorbit import KeplerOrbit
-from zoomsprite import AbstractCelestialBody, Planet, Sun, PlanetGroup, OrbitEllipse, ZoomGroup
+import pygame
+import simclock
+import catalogue
+from keplersolver import TableSolver, MarkleySolver
+from ephemeris import EphemerisTable
+from zoomsprite import AbstractCelestialBody, Planet, Sun, PlanetGroup, MinorBodyGroup, OrbitEllipse, TraceGroup
 from label import Label, LabelGroup
+from profiler import FrameProfiler
+from scheduler import FixedStepScheduler
 from sciformat import SciFormat
-from dateutil.relativedelta import relativedelta
 import tkinter as tk
 from tkinter import simpledialog, messagebox
 
@@ -19,37 +23,39 @@ class SolarSystem:
 
     # Constants
     SPEED = [
-        (relativedelta(years=-100), "-100 y/s"),
-        (relativedelta(years=-50), "-50 y/s"),
-        (relativedelta(years=-10), "-10 y/s"),
-        (relativedelta(years=-5), "-5 y/s"),
-        (relativedelta(years=-1), "-1 y/s"),
-        (relativedelta(months=-6), "-6 mos/s"),
-        (relativedelta(months=-1), "-1 mo/s"),
-        (relativedelta(weeks=-1), "-1 w/s"),
-        (relativedelta(days=-1), "-1 d/s"),
-        (relativedelta(hours=-1), "-1 h/s"),
-        (relativedelta(minutes=-1), "-1 min/s"),
-        (relativedelta(seconds=-1), "-1 s/s"),
-        (relativedelta(seconds=0), "Time freeze"),
-        (relativedelta(seconds=1), "Real time"),
-        (relativedelta(minutes=1), "1 min/s"),
-        (relativedelta(hours=1), "1 h/s"),
-        (relativedelta(days=1), "1 d/s"),
-        (relativedelta(weeks=1), "1 w/s"),
-        (relativedelta(months=1), "1 mo/s"),
-        (relativedelta(months=6), "6 mos/s"),
-        (relativedelta(years=1), "1 y/s"),
-        (relativedelta(years=5), "5 y/s"),
-        (relativedelta(years=10), "10 y/s"),
-        (relativedelta(years=50), "50 y/s"),
-        (relativedelta(years=100), "100 y/s")
-    ]
+        (-100 * simclock.YEAR, "-100 y/s"),
+        (-50 * simclock.YEAR, "-50 y/s"),
+        (-10 * simclock.YEAR, "-10 y/s"),
+        (-5 * simclock.YEAR, "-5 y/s"),
+        (-simclock.YEAR, "-1 y/s"),
+        (-6 * simclock.MONTH, "-6 mos/s"),
+        (-simclock.MONTH, "-1 mo/s"),
+        (-simclock.WEEK, "-1 w/s"),
+        (-simclock.DAY, "-1 d/s"),
+        (-simclock.HOUR, "-1 h/s"),
+        (-simclock.MINUTE, "-1 min/s"),
+        (-1, "-1 s/s"),
+        (0, "Time freeze"),
+        (1, "Real time"),
+        (simclock.MINUTE, "1 min/s"),
+        (simclock.HOUR, "1 h/s"),
+        (simclock.DAY, "1 d/s"),
+        (simclock.WEEK, "1 w/s"),
+        (simclock.MONTH, "1 mo/s"),
+        (6 * simclock.MONTH, "6 mos/s"),
+        (simclock.YEAR, "1 y/s"),
+        (5 * simclock.YEAR, "5 y/s"),
+        (10 * simclock.YEAR, "10 y/s"),
+        (50 * simclock.YEAR, "50 y/s"),
+        (100 * simclock.YEAR, "100 y/s")
+    ] # Simulated seconds per second
     FREEZE_INDEX = 12 # SPEED index of time freeze
     MAX_ZOOM = 170
     MIN_ZOOM = 0.01
     JUPITER_RADIUS_AT_ZOOM_ONE = 15
-    EPOCH = datetime.datetime(year=2000, month=1, day=1, hour=12)
+    TICK_LENGTH = 0.001 # Wall-clock seconds per simulation tick
+    PROFILE_INTERVAL = 30 # Frames between updates of the profiler overlay
+    RENDER_ACCURACY = 1e-6 # Max error in eccentric anomaly when animating. Below one pixel for Pluto at MAX_ZOOM.
     UP, DOWN = 1, -1
     "Label texts"
     HELP_LBL = "F1: Help"
@@ -63,9 +69,17 @@ class SolarSystem:
     ORBIT_HELP_LBL = "1-9: Select planet"
     SET_DATE_HELP_LBL = "F2: Set date"
     TOGGLE_TRACE_HELP_LBL = "F3: Toggle tracing"
+    FIND_BODY_HELP_LBL = "F6: Find body"
+    PICK_HELP_LBL = "Click: Select body"
+    PROFILE_HELP_LBL = "F7: Toggle profiler"
     PLANET_INFO_LBL = "{}"
-    DISTANCE_INFO_LBL = "Distance to sun: {:.02} km"
-    SPEED_INFO_LBL = "Speed: {:3.02} km/s"
+    DISTANCE_INFO_LBL = "Distance to sun: {} km"
+    SPEED_INFO_LBL = "Speed: {} km/s"
+    DISTANCE_FORMAT = SciFormat.compile(".02")
+    SPEED_FORMAT = SciFormat.compile("3.02")
+    PROFILE_LBL = "{}: {:.2f} / {:.2f} ms"
+    FPS_LBL = "fps: {:.1f}"
+    PROFILE_STAGES = ("events", "propagate", "labels", "traces", "sprites", "display", "frame") # Shown in the profiler overlay
     # Colors
     BACKGROUND = (0, 0, 0)
     SUN = (0xFF, 0xCC, 0x33)
@@ -80,23 +94,65 @@ class SolarSystem:
     PLUTO = (0xFF, 0xF1, 0xD5)
     TEXT = SUN
     TRACE = (0x50, 0x50, 0x50)
+    MINOR_BODY = (0x90, 0x90, 0x90)
+    MAX_MINOR_SPRITES = 500 # Upper bound on the number of minor body sprites on screen
+    PICK_RADIUS = 6 # Max distance in pixels from a click to the body it selects
+    # Radius relative to Jupiter, color and rings of bodies in catalogue.PLANETS
+    APPEARANCE = {
+        "Mercury": (0.034, MERCURY, []),
+        "Venus": (0.085, VENUS, []),
+        "Earth": (0.089, EARTH, []),
+        "Mars": (0.048, MARS, []),
+        "Jupiter": (1.0, JUPITER, []),
+        "Saturn": (0.843, SATURN, [1.3, 1.6, 1.9]),
+        "Uranus": (0.358, URANUS, [1.3, 1.6]),
+        "Neptune": (0.346, NEPTUNE, []),
+        "Pluto": (0.017, PLUTO, [])
+    }
 
-    def __init__(self):
-        """Create a new SolarSystem."""
+    def __init__(self, ephemeris=None, bodies=None, band=None):
+        """Create a new SolarSystem.
+
+        Args:
+            ephemeris (string): Path to a precomputed npy or col ephemeris of the planets, see ephemeris.py. Positions
+                are interpolated from it within its time range instead of being computed.
+            bodies (string): Path to a JSON, CSV or MPCORB element file of minor bodies to show, see catalogue.py.
+            band (string): Only show minor bodies in this orbital band, see Catalogue.BANDS. All bodies if None.
+
+        Members:
+            dirtyRendering (bool): If True, update() only redraws and reports screen areas that changed.
+                Otherwise the whole screen is redrawn every frame.
+            maxFps (int): Upper bound on frames per second for the game loop, or 0 for no bound. Simulation time
+                follows the wall clock through scheduler at any frame rate.
+            scheduler (FixedStepScheduler): Turns elapsed wall-clock time into simulation ticks of timeStep each.
+            profiler (FrameProfiler): Stage timings of update() and of the game loop. The overlay toggled with F7
+                shows the frame rate measured by scheduler and the median and 95th percentile of each stage in
+                PROFILE_STAGES.
+        """
         AbstractCelestialBody.referenceRadius = SolarSystem.JUPITER_RADIUS_AT_ZOOM_ONE
         self.screenSize = (800, 600)
-        self.fps = 30
+        self.maxFps = 60
+        self.scheduler = FixedStepScheduler(SolarSystem.TICK_LENGTH)
         self.zoomStepFactor = 1.1
         self.speedIndex = SolarSystem.FREEZE_INDEX + 6
-        self.targetTime =  SolarSystem.EPOCH + SolarSystem.SPEED[self.speedIndex][0]
         self.updateTimeStep()
         self.screen = pygame.display.set_mode(self.screenSize, pygame.HWSURFACE|pygame.DOUBLEBUF|pygame.RESIZABLE)
-        self.cbSprites = PlanetGroup()
-        self.traceSprites = ZoomGroup()
+        self.profiler = FrameProfiler()
+        self.cbSprites = PlanetGroup(solver=TableSolver(SolarSystem.RENDER_ACCURACY))
+        self.traceSprites = TraceGroup(SolarSystem.BACKGROUND)
         self.cbSprites.zoom = self.traceSprites.zoom = 1
         self.initSprites()
+        self.minorSprites = None
+        if bodies != None:
+            self.initMinorBodies(catalogue.Catalogue.load(bodies), band)
+        self.selectedTrace = None
+        if ephemeris != None:
+            self.cbSprites.attachEphemeris(EphemerisTable(ephemeris))
         self.paused = False
         self.showTraces = False
+        self.dirtyRendering = True
+        self.fullRedraw = True
+        self.drawn = dict()
         self.selectedPlanet = 2
         self.initLabels()
         self.updateLabelPositions()
@@ -105,41 +161,31 @@ class SolarSystem:
 
     def initSprites(self):
         """Create solar system object sprites."""
-        mercuryOrbit = KeplerOrbit(e=0.21, a=57909050000, T=SolarSystem._toSeconds(87.9691), O=SolarSystem._toRadians(48.331), o=SolarSystem._toRadians(29.124), M=SolarSystem._toRadians(174.796))
-        mercuryTrace = OrbitEllipse(mercuryOrbit, SolarSystem.TRACE)
-        mercury = Planet("Mercury", mercuryOrbit, 0.034, SolarSystem.MERCURY)
-        venusOrbit = KeplerOrbit(e=0.0068, a=1.08208628e11, T=SolarSystem._toSeconds(224.7), O=SolarSystem._toRadians(76.680), o=SolarSystem._toRadians(54.884), M=SolarSystem._toRadians(50.115))
-        venusTrace = OrbitEllipse(venusOrbit, SolarSystem.TRACE)
-        venus = Planet("Venus", venusOrbit, 0.085, SolarSystem.VENUS)
-        earthOrbit = KeplerOrbit()
-        earthTrace = OrbitEllipse(earthOrbit, SolarSystem.TRACE)
-        earth = Planet("Earth", earthOrbit, 0.089, SolarSystem.EARTH)
-        marsOrbit = KeplerOrbit(e=0.0934, a=2.27942276e11, T=SolarSystem._toSeconds(687.0), O=SolarSystem._toRadians(49.558), o=SolarSystem._toRadians(286.502), M=SolarSystem._toRadians(19.412))
-        marsTrace = OrbitEllipse(marsOrbit, SolarSystem.TRACE)
-        mars = Planet("Mars", marsOrbit, 0.048, SolarSystem.MARS)
-        jupiterOrbit = KeplerOrbit(e=0.0489, a=7.7857e11, T=SolarSystem._toSeconds(4332.59), O=SolarSystem._toRadians(100.464), o=SolarSystem._toRadians(273.867), M=SolarSystem._toRadians(20.020))
-        jupiterTrace = OrbitEllipse(jupiterOrbit, SolarSystem.TRACE)
-        jupiter = Planet("Jupiter", jupiterOrbit, 1.0, SolarSystem.JUPITER)
-        saturnOrbit = KeplerOrbit(e=0.0565, a=1.43353e12, T=SolarSystem._toSeconds(10759.22), O=SolarSystem._toRadians(113.665), o=SolarSystem._toRadians(339.392), M=SolarSystem._toRadians(317.020))
-        saturnTrace = OrbitEllipse(saturnOrbit, SolarSystem.TRACE)
-        saturn = Planet("Saturn", saturnOrbit, 0.843, SolarSystem.SATURN, [1.3, 1.6, 1.9])
-        uranusOrbit = KeplerOrbit(e=0.046381, a=2.87504e12, T=SolarSystem._toSeconds(30688.5), O=SolarSystem._toRadians(74.006), o=SolarSystem._toRadians(96.998857), M=SolarSystem._toRadians(142.2386))
-        uranusTrace = OrbitEllipse(uranusOrbit, SolarSystem.TRACE)
-        uranus = Planet("Uranus", uranusOrbit, 0.358, SolarSystem.URANUS, [1.3, 1.6])
-        neptuneOrbit = KeplerOrbit(e=0.009456, a=4.50439e12, T=SolarSystem._toSeconds(60182), O=SolarSystem._toRadians(131.784), o=SolarSystem._toRadians(276.336), M=SolarSystem._toRadians(256.228))
-        neptuneTrace = OrbitEllipse(neptuneOrbit, SolarSystem.TRACE)
-        neptune = Planet("Neptune", neptuneOrbit, 0.346, SolarSystem.NEPTUNE)
-        plutoOrbit = KeplerOrbit(e=0.2488, a=5.90638e12, T=SolarSystem._toSeconds(90560), O=SolarSystem._toRadians(110.299), o=SolarSystem._toRadians(113.834), M=SolarSystem._toRadians(14.53))
-        plutoTrace = OrbitEllipse(plutoOrbit, SolarSystem.TRACE)
-        pluto = Planet("Pluto", plutoOrbit, 0.017, SolarSystem.PLUTO)
+        planets, traces = [], []
+        for elements in catalogue.PLANETS:
+            radius, color, rings = SolarSystem.APPEARANCE[elements["name"]]
+            orbit = catalogue.createOrbit(elements)
+            traces.append(OrbitEllipse(orbit, SolarSystem.TRACE))
+            planets.append(Planet(elements["name"], orbit, radius, color, rings))
         sun = Sun(0.15, self.SUN, 3)
-        self.cbSprites.add(mercury, venus, earth, mars, jupiter, saturn, uranus, neptune, pluto, sun)
-        self.traceSprites.add(mercuryTrace, venusTrace, earthTrace, marsTrace, jupiterTrace, saturnTrace, uranusTrace, neptuneTrace, plutoTrace)
+        self.cbSprites.add(*planets, sun)
+        self.traceSprites.add(*traces)
+
+    def initMinorBodies(self, bodies, band=None):
+        """Create the group of minor body sprites. Sprites are only created for bodies that are on screen.
+
+        Args:
+            bodies (Catalogue): The minor bodies.
+            band (string): Only show bodies in this orbital band. All bodies if None.
+        """
+        indices = bodies.band(band) if band != None else None
+        self.minorSprites = MinorBodyGroup(bodies, indices, SolarSystem.MINOR_BODY, SolarSystem.MAX_MINOR_SPRITES, MarkleySolver())
+        self.minorSprites.zoom = self.cbSprites.zoom
 
     def initLabels(self):
         """Create info text labels."""
         font = pygame.font.SysFont("arial", 12, bold=True)
-        self.labelGroups = {"static": LabelGroup(True), "help": LabelGroup(False), "state": LabelGroup(True), "realtime": LabelGroup(True)}
+        self.labelGroups = {"static": LabelGroup(True), "help": LabelGroup(False), "state": LabelGroup(True), "realtime": LabelGroup(True), "profile": LabelGroup(False)}
         helpLabel = Label(font, SolarSystem.TEXT, text=SolarSystem.HELP_LBL, bottom=10, right=10)
         self.labelGroups["static"].add("help", helpLabel)
         labelHeight = helpLabel.rect.height
@@ -156,6 +202,12 @@ class SolarSystem:
         self.labelGroups["help"].add("date", setDateLabel)
         toggleTracingLabel = Label(font, SolarSystem.TEXT, text=SolarSystem.TOGGLE_TRACE_HELP_LBL, top=labelHeight * 5 + 10, right=10)
         self.labelGroups["help"].add("tracing", toggleTracingLabel)
+        findBodyLabel = Label(font, SolarSystem.TEXT, text=SolarSystem.FIND_BODY_HELP_LBL, top=labelHeight * 6 + 10, right=10)
+        self.labelGroups["help"].add("find", findBodyLabel)
+        pickLabel = Label(font, SolarSystem.TEXT, text=SolarSystem.PICK_HELP_LBL, top=labelHeight * 7 + 10, right=10)
+        self.labelGroups["help"].add("pick", pickLabel)
+        profileKeyLabel = Label(font, SolarSystem.TEXT, text=SolarSystem.PROFILE_HELP_LBL, top=labelHeight * 8 + 10, right=10)
+        self.labelGroups["help"].add("profile", profileKeyLabel)
 
         timeLabel = Label(font, SolarSystem.TEXT, top=10, left=10)
         self.labelGroups["realtime"].add("time", timeLabel)
@@ -167,64 +219,147 @@ class SolarSystem:
         self.labelGroups["realtime"].add("speedInfo", speedInfoLabel)
         self.updateRealtimeLabels()
 
+        self.labelGroups["profile"].add("fps", Label(font, SolarSystem.TEXT, top=labelHeight * 5 + 10, left=10))
+        for i, stage in enumerate(SolarSystem.PROFILE_STAGES):
+            self.labelGroups["profile"].add(stage, Label(font, SolarSystem.TEXT, top=labelHeight * (6 + i) + 10, left=10))
+
         zoomLabel = Label(font, SolarSystem.TEXT, text=SolarSystem.ZOOM_LBL.format(SolarSystem._toPercent(self.cbSprites.zoom)), bottom=10, left=10)
         self.labelGroups["state"].add("zoom", zoomLabel)
         speedLabel = Label(font, SolarSystem.TEXT, text=SolarSystem.SPEED_LBL.format(SolarSystem.SPEED[self.speedIndex][1]), bottom=10, left=30 + zoomLabel.rect.width)
         self.labelGroups["state"].add("speed", speedLabel)
 
     def update(self):
-        """Update orbits in game loop."""
-        self.screen.fill(SolarSystem.BACKGROUND)
+        """Update orbits in game loop.
+
+        Returns:
+            list of Rect: Screen areas that changed and need to be presented. Empty if nothing changed.
+        """
+        Planet.time += self.scheduler.advance() * self.timeStep
+        with self.profiler.stage("propagate"):
+            self.cbSprites.update()
+            if self.minorSprites != None:
+                self.minorSprites.update()
+        with self.profiler.stage("labels"):
+            if (self.labelGroups["realtime"].display):
+                self.updateRealtimeLabels()
+            if self.labelGroups["profile"].display and self.profiler.frames % SolarSystem.PROFILE_INTERVAL == 0:
+                self.updateProfileLabels()
+        items = self.getDrawables()
+        if self.dirtyRendering and not self.fullRedraw:
+            return self.redrawChanged(items)
+        return self.redrawAll(items)
+
+    def getDrawables(self):
+        """Return a (key, image, rect) tuple for every sprite on screen and every visible label in drawing order."""
+        screenRect = self.screen.get_rect()
+        sprites = self.minorSprites.sprites() + self.cbSprites.sprites() if self.minorSprites != None else self.cbSprites.sprites()
+        items = [(sprite, sprite.image, sprite.rect) for sprite in sprites if screenRect.colliderect(sprite.rect)]
+        for group in self.labelGroups.values():
+            if group.display:
+                items.extend((label, label.render, label.rect) for label in group)
+        return items
+
+    def redrawAll(self, items):
+        """Clear the screen and draw all items.
+
+        Returns:
+            list of Rect: The whole screen.
+        """
+        with self.profiler.stage("traces"):
+            self.clearArea()
+        with self.profiler.stage("sprites"):
+            self.screen.blits([(image, rect) for _, image, rect in items], doreturn=False)
+        self.drawn = {key: (image, rect.copy()) for key, image, rect in items}
+        self.fullRedraw = False
+        return [self.screen.get_rect()]
+
+    def redrawChanged(self, items):
+        """Redraw the areas covered by items that moved, changed image, appeared or disappeared since last frame.
+
+        Returns:
+            list of Rect: The redrawn areas. Empty if nothing changed.
+        """
+        dirty = []
+        drawn = dict()
+        for key, image, rect in items:
+            previous = self.drawn.pop(key, None)
+            if previous == None or previous[0] is not image or previous[1] != rect:
+                dirty.append(rect)
+                if previous != None:
+                    dirty.append(previous[1])
+            drawn[key] = (image, rect.copy())
+        dirty.extend(rect for _, rect in self.drawn.values()) # Items that are no longer drawn
+        self.drawn = drawn
+        screenRect = self.screen.get_rect()
+        dirty = [rect.clip(screenRect) for rect in dirty if rect.colliderect(screenRect)]
+        for area in dirty:
+            self.screen.set_clip(area)
+            with self.profiler.stage("traces"):
+                self.clearArea(area)
+            with self.profiler.stage("sprites"):
+                self.screen.blits([(image, rect) for _, image, rect in items if area.colliderect(rect)], doreturn=False)
+        self.screen.set_clip(None)
+        return dirty
+
+    def clearArea(self, area=None):
+        """Restore the background, including traces if shown, in area or on the whole screen if area is None."""
         if self.showTraces:
-            self.traceSprites.draw(self.screen)
-        self.cbSprites.update()
-        self.cbSprites.draw(self.screen)
-        Planet.time += self.timeStep
-        if (self.labelGroups["realtime"].display):
-            self.updateRealtimeLabels()
-        self.showLabels()
-        if (self.speedIndex > SolarSystem.FREEZE_INDEX and Planet.time >= self.targetTime) or (self.speedIndex < SolarSystem.FREEZE_INDEX and Planet.time <= self.targetTime):
-            self.targetTimeReached = True
-        if self.targetTimeReached:
-            # This construction allows for other methods to set targetTimeReached to True
-            # so that we'll be able to take immediate action on e.g. speed changes.
-            self.updateTimeStep()
+            if area == None:
+                self.traceSprites.draw(self.screen) # The trace layer covers the screen
+            else:
+                self.screen.blit(self.traceSprites.layer, area, area)
+        else:
+            self.screen.fill(SolarSystem.BACKGROUND, area)
 
     def updateRealtimeLabels(self):
         """Update labels in the realtime group. This is done at every update call."""
         # Time label
-        time = ""
-        if (self.speedIndex > 7 and self.speedIndex < 17):
-            time = Planet.time.strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            time = Planet.time.strftime("%Y-%m-%d")
+        time = simclock.formatTime(Planet.time, showTime=self.speedIndex > 7 and self.speedIndex < 17)
         text = SolarSystem.PAUSED_LBL if self.paused else SolarSystem.TIME_LBL
         self.labelGroups["realtime"].get("time").text = text.format(time)
         # Planet info
-        selected = self.cbSprites.orbits[self.selectedPlanet]
-        distance = SciFormat(selected.orbit.r / 1000)
-        speed = SciFormat(selected.orbit.v / 1000)
-        self.labelGroups["realtime"].get("planetInfo").text = SolarSystem.PLANET_INFO_LBL.format(selected.name)
+        if self.minorSprites != None and self.minorSprites.selected != None:
+            orbitSet, index = self.minorSprites.orbitSet, self.minorSprites.selected
+            name = self.minorSprites.catalogue.names[self.minorSprites.indices[index]]
+        else:
+            orbitSet, index = self.cbSprites.orbitSet, self.cbSprites.orbits[self.selectedPlanet].index
+            name = self.cbSprites.orbits[self.selectedPlanet].name
+        distance = SolarSystem.DISTANCE_FORMAT.format(orbitSet.r[index] / 1000)
+        speed = SolarSystem.SPEED_FORMAT.format(orbitSet.v[index] / 1000)
+        self.labelGroups["realtime"].get("planetInfo").text = SolarSystem.PLANET_INFO_LBL.format(name)
         self.labelGroups["realtime"].get("distanceInfo").text = SolarSystem.DISTANCE_INFO_LBL.format(distance)
         self.labelGroups["realtime"].get("speedInfo").text = SolarSystem.SPEED_INFO_LBL.format(speed)
         # Render and position
         screenSize = self.screen.get_size()
         for label in self.labelGroups["realtime"]:
-            label.renderLabel()
-            label.udpatePosition(screenSize)
+            if label.renderLabel():
+                label.udpatePosition(screenSize)
+
+    def updateProfileLabels(self):
+        """Show the frame rate and the median and 95th percentile time of each profiled stage over the profiler window."""
+        screenSize = self.screen.get_size()
+        texts = [("fps", SolarSystem.FPS_LBL.format(self.scheduler.fps))]
+        texts += [(stage, SolarSystem.PROFILE_LBL.format(stage, *self.profiler.percentiles(stage, (50, 95)))) for stage in SolarSystem.PROFILE_STAGES]
+        for name, text in texts:
+            label = self.labelGroups["profile"].get(name)
+            label.text = text
+            if label.renderLabel():
+                label.udpatePosition(screenSize)
 
     def updateTimeStep(self):
-        """Set timestep per frame from current speed and fps."""
-        self.targetTime = Planet.time + SolarSystem.SPEED[self.speedIndex][0]
-        self.timeStep = datetime.timedelta(seconds=(self.targetTime - Planet.time).total_seconds() / self.fps)
-        self.targetTimeReached = False
+        """Set simulated time per scheduler tick from current speed."""
+        self.timeStep = SolarSystem.SPEED[self.speedIndex][0] * self.scheduler.tickLength
 
     def updateOrigo(self):
         """Find origo on screen and update sprites."""
         width, height = self.screen.get_size()
         origo = (width // 2, height // 2)
         self.cbSprites.origo = origo
+        self.cbSprites.screenSize = (width, height)
         self.traceSprites.origo = origo
+        if self.minorSprites != None:
+            self.minorSprites.origo = origo
+            self.minorSprites.screenSize = (width, height)
 
     def updateLabelPositions(self, group=None):
         """Set on-screen positions of info text labels."""
@@ -237,13 +372,6 @@ class SolarSystem:
             for label in group:
                 label.udpatePosition(screenSize)
 
-    def showLabels(self):
-        """Print info on screen."""
-        for group in self.labelGroups.values():
-            if group.display:
-                for label in group:
-                    self.screen.blit(label.render, label.rect)
-
     def stepSpeed(self, direction):
         """Step speed in direction.
         
@@ -251,10 +379,10 @@ class SolarSystem:
             direction (int): 1 is one step up and -1 is one step down.
         """
         if not self.paused:
-            self.targetTimeReached = True # Force immediate action on next update()
             newSpeedIndex = self.speedIndex + direction
             if (newSpeedIndex >= 0 and newSpeedIndex < len(SolarSystem.SPEED)):
                 self.speedIndex += direction
+                self.updateTimeStep()
                 self.labelGroups["state"].get("speed").text = SolarSystem.SPEED_LBL.format(SolarSystem.SPEED[self.speedIndex][1])
                 self.labelGroups["state"].get("speed").renderLabel()
                 self.updateLabelPositions()
@@ -270,6 +398,9 @@ class SolarSystem:
         if newZoom >= SolarSystem.MIN_ZOOM and newZoom <= SolarSystem.MAX_ZOOM:
             self.cbSprites.zoom = newZoom
             self.traceSprites.zoom = newZoom
+            if self.minorSprites != None:
+                self.minorSprites.zoom = newZoom
+            self.fullRedraw = True
             self.labelGroups["state"].get("zoom").text = SolarSystem.ZOOM_LBL.format(SolarSystem._toPercent(self.cbSprites.zoom))
             self.labelGroups["state"].get("zoom").renderLabel()
             self.updateLabelPositions()
@@ -278,19 +409,67 @@ class SolarSystem:
         """Show dialog to get date from user.
         
         Returns:
-            datetime or bool: False if cancelled or invalid user input, datetime object otherwise.
+            float or bool: False if cancelled or invalid user input, seconds since J2000 otherwise.
         """
         root = tk.Tk().wm_withdraw()
         dateStr = simpledialog.askstring("Set date", "Date (yyy-mm-dd [H[:M[:S]]])", parent=root)
         if dateStr == None:
             return False        
         try:
-            time = datetime.datetime.fromisoformat(dateStr)
+            time = simclock.parse(dateStr)
             return time
         except ValueError:
             messagebox.showerror("Error", "Invalid date format.")
             return False
 
+    def getUserInputBody(self):
+        """Show dialog to get the name or designation of a minor body from user.
+
+        Returns:
+            int or bool: False if cancelled or not found, catalogue index of the body otherwise.
+        """
+        root = tk.Tk().wm_withdraw()
+        key = simpledialog.askstring("Find body", "Name or designation", parent=root)
+        if key == None:
+            return False
+        try:
+            return self.minorSprites.catalogue.find(key)
+        except KeyError:
+            messagebox.showerror("Error", f"No body named {key}.")
+            return False
+
+    def selectBody(self, index):
+        """Select a minor body, show its orbit and the body info labels. None selects the planet again.
+
+        Args:
+            index (int): Catalogue index of the body, or None.
+        """
+        if self.selectedTrace != None:
+            self.traceSprites.remove(self.selectedTrace)
+            self.selectedTrace = None
+        if self.minorSprites == None:
+            return
+        self.minorSprites.select(index)
+        if index != None:
+            self.selectedTrace = OrbitEllipse(self.minorSprites.catalogue.getOrbit(index), SolarSystem.MINOR_BODY)
+            self.traceSprites.add(self.selectedTrace)
+        self.fullRedraw = True
+
+    def pickBody(self, position):
+        """Select the planet or minor body at a screen position, if any.
+
+        Args:
+            position (int, int): Screen coordinates in pixels.
+        """
+        planet = self.cbSprites.pick(position, SolarSystem.PICK_RADIUS)
+        if planet != None:
+            self.selectedPlanet = planet
+            self.selectBody(None)
+        elif self.minorSprites != None:
+            body = self.minorSprites.pick(position, SolarSystem.PICK_RADIUS)
+            if body != None:
+                self.selectBody(body)
+
     def eventHandler(self, event):
         """Handle a pygame event.
         
@@ -303,6 +482,9 @@ class SolarSystem:
             self.screen = pygame.display.set_mode(event.dict['size'], pygame.HWSURFACE|pygame.DOUBLEBUF|pygame.RESIZABLE)
             self.updateOrigo()
             self.updateLabelPositions()
+            self.fullRedraw = True
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.pickBody(event.pos)
         elif event.type == pygame.KEYDOWN:
             if event.key == pygame.K_ESCAPE or (pygame.K_F4 and (event.mod & pygame.KMOD_ALT)):
                 self.isAlive = False
@@ -321,41 +503,30 @@ class SolarSystem:
                     self.speedIndex = SolarSystem.FREEZE_INDEX
                 else:
                     self.speedIndex = self.pausIndex
-                self.targetTimeReached = True
+                self.updateTimeStep()
             elif event.key == pygame.K_F1:
                 self.labelGroups["help"].display = not self.labelGroups["help"].display
             elif event.key in range(pygame.K_1, pygame.K_9 + 1):
                 self.selectedPlanet = event.key - pygame.K_1
+                self.selectBody(None)
             elif event.key == pygame.K_F2:
                 time = self.getUserInputDate()
-                if isinstance(time, datetime.datetime):
+                if isinstance(time, float):
                     Planet.time = time
+                self.scheduler.reset()
             elif event.key == pygame.K_F3:
                 self.showTraces = not self.showTraces
-
-    @staticmethod
-    def _toRadians(degrees):
-        """Convert degrees to radians.
-
-        Args:
-            degrees (float): Angle expressed in degrees.
-        
-        Returns:
-            float: Angle expressed in radians.
-        """
-        return degrees * math.pi / 180
-
-    @staticmethod
-    def _toSeconds(days):
-        """Convert days to seconds.
-        
-        Args:
-            days (int): Time expressed in days.
-
-        Returns:
-            float: Time expressed in seconds.
-        """
-        return days * 86400
+                self.fullRedraw = True
+            elif event.key == pygame.K_F7:
+                self.labelGroups["profile"].display = not self.labelGroups["profile"].display
+                self.profiler.enabled = self.labelGroups["profile"].display or self.profiler.logging
+                if self.profiler.enabled:
+                    self.updateProfileLabels()
+            elif event.key == pygame.K_F6 and self.minorSprites != None:
+                index = self.getUserInputBody()
+                if index is not False:
+                    self.selectBody(index)
+                self.scheduler.reset()
 
     @staticmethod
     def _toPercent(value, precision=0):
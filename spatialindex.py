@@ -0,0 +1,90 @@
+"""spatialindex.py: A uniform grid over points on screen for culling and picking."""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+import math
+import numpy as np
+
+class GridIndex:
+    """Index points in screen coordinates by the grid cell they fall in.
+
+    Points outside bounds are culled when the index is created, which is a single vectorized comparison. The
+    points inside are sorted by cell the first time the index is queried, after which a rectangle query costs
+    one binary search per row of cells it covers.
+
+    Members:
+        visible (numpy.ndarray): Indices of the points within bounds, in increasing order.
+        cellSize (int): Side of a grid cell in pixels.
+    """
+
+    def __init__(self, xs, ys, bounds, cellSize=32):
+        """Create a new GridIndex.
+
+        Args:
+            xs (numpy.ndarray): Horizontal screen coordinates of the points in pixels.
+            ys (numpy.ndarray): Vertical screen coordinates of the points in pixels.
+            bounds (int, int, int, int): Left, top, width and height of the indexed area in pixels.
+            cellSize (int): Side of a grid cell in pixels.
+        """
+        self.xs, self.ys = np.asarray(xs), np.asarray(ys)
+        self.bounds = bounds
+        self.cellSize = cellSize
+        left, top, width, height = bounds
+        self.visible = np.flatnonzero((self.xs >= left) & (self.xs < left + width) & (self.ys >= top) & (self.ys < top + height))
+        self._columns = max(1, math.ceil(width / cellSize))
+        self._keys = None
+        self._order = None
+
+    def __len__(self):
+        """Return the number of points within bounds."""
+        return len(self.visible)
+
+    def query(self, left, top, width, height):
+        """Return the indices of all points within a rectangle.
+
+        Args:
+            left, top, width, height (int): The rectangle in pixels.
+
+        Returns:
+            numpy.ndarray: Indices of the points, in no particular order.
+        """
+        if self._keys is None:
+            self._build()
+        boundsLeft, boundsTop, boundsWidth, boundsHeight = self.bounds
+        column0 = max(0, (left - boundsLeft) // self.cellSize)
+        column1 = min(self._columns - 1, (left + width - 1 - boundsLeft) // self.cellSize)
+        row0 = max(0, (top - boundsTop) // self.cellSize)
+        row1 = min(math.ceil(boundsHeight / self.cellSize) - 1, (top + height - 1 - boundsTop) // self.cellSize)
+        if column1 < column0 or row1 < row0:
+            return np.empty(0, dtype=np.intp)
+        rows = np.arange(row0, row1 + 1) * self._columns
+        starts = np.searchsorted(self._keys, rows + column0, side="left")
+        stops = np.searchsorted(self._keys, rows + column1, side="right")
+        candidates = np.concatenate([self._order[start:stop] for start, stop in zip(starts.tolist(), stops.tolist())])
+        xs, ys = self.xs[candidates], self.ys[candidates]
+        return candidates[(xs >= left) & (xs < left + width) & (ys >= top) & (ys < top + height)]
+
+    def nearest(self, x, y, maxDistance):
+        """Return the index of the point closest to (x, y), or None if no point is within maxDistance pixels."""
+        candidates = self.query(x - maxDistance, y - maxDistance, 2 * maxDistance + 1, 2 * maxDistance + 1)
+        if len(candidates) == 0:
+            return None
+        distances = (self.xs[candidates] - x)**2 + (self.ys[candidates] - y)**2
+        best = np.argmin(distances)
+        return int(candidates[best]) if distances[best] <= maxDistance**2 else None
+
+    def _build(self):
+        """Sort the points within bounds by grid cell."""
+        left, top = self.bounds[:2]
+        columns = (self.xs[self.visible] - left) // self.cellSize
+        rows = (self.ys[self.visible] - top) // self.cellSize
+        keys = (rows * self._columns + columns).astype(np.int64)
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._order = keys[order], self.visible[order]
+
+
+if __name__ == "__main__":
+    print("Warning: spatialindex.py is not intended to run stand-alone.")
@@ -0,0 +1,45 @@
+"""test_eventsearch.py: Compare EventSearch with a brute-force scan of the planet orbits."""
+
+__author__ = "Andreas Andersson"
+__copyright__ = "Copyright 2020, Andreas Andersson"
+__contact__ = "andreas.andersson@tutanota.com"
+
+
+import numpy as np
+import simclock
+import catalogue
+from orbitset import OrbitSet
+from eventsearch import EventSearch
+
+COARSE_STEP = simclock.HOUR
+FINE_STEP = 10.0
+
+
+def distance(orbit1, orbit2, t):
+    """Return the distance between two KeplerOrbits at times t, computed by each orbit on its own."""
+    positions1, positions2 = orbit1.getPositions(t, dimensions=3), orbit2.getPositions(t, dimensions=3)
+    return np.sqrt((positions1.x - positions2.x)**2 + (positions1.y - positions2.y)**2 + (positions1.z - positions2.z)**2)
+
+
+def bruteForceApproaches(orbit1, orbit2, start, stop):
+    """Return the times of the local minima of the distance between two orbits, scanned hourly and then every FINE_STEP seconds."""
+    t = np.arange(start, stop, COARSE_STEP)
+    coarse = distance(orbit1, orbit2, t)
+    minima = np.flatnonzero((coarse[1:-1] < coarse[:-2]) & (coarse[1:-1] <= coarse[2:])) + 1
+    fine = t[minima, np.newaxis] + np.arange(-COARSE_STEP, COARSE_STEP + FINE_STEP, FINE_STEP)
+    return fine[np.arange(len(fine)), np.argmin(distance(orbit1, orbit2, fine), axis=1)]
+
+
+def test_closeApproachesMatchBruteForce():
+    orbits = [catalogue.createOrbit(elements) for elements in catalogue.PLANETS]
+    search = EventSearch(OrbitSet(*orbits), tolerance=60.0)
+    names = [elements["name"] for elements in catalogue.PLANETS]
+    pairs = [(names.index("Earth"), names.index("Mars")), (names.index("Venus"), names.index("Earth")), (names.index("Jupiter"), names.index("Saturn"))]
+    start, stop = 0.0, 50 * simclock.YEAR
+    events = search.closeApproaches(pairs, start, stop)
+    for index, (body1, body2) in enumerate(pairs):
+        expected = bruteForceApproaches(orbits[body1], orbits[body2], start, stop)
+        found = events.t[events.pair == index]
+        assert len(found) == len(expected)
+        assert np.max(np.abs(found - expected)) <= search.tolerance + FINE_STEP
+        assert np.allclose(events.value[events.pair == index], distance(orbits[body1], orbits[body2], found), rtol=1e-9)
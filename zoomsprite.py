@@ -5,8 +5,12 @@ __copyright__ = "Copyright 2020, Andreas Andersson"
 __contact__ = "andreas.andersson@tutanota.com"
 
 
-import pygame, math, datetime, types
+import pygame, math, types
+import numpy as np
 from keplerorbit import KeplerOrbit
+from orbitset import OrbitSet
+from lrucache import LRUCache
+from spatialindex import GridIndex
 
 class AbstractZoomSprite(pygame.sprite.Sprite):
     """Base class for zoomable sprites."""
@@ -52,8 +56,11 @@ class AbstractCelestialBody(AbstractZoomSprite):
 
     Class members:
         referenceRadius (int): Radius in pixels corresponding to a relative radius of one.
+        imageCache (LRUCache): Rendered body images shared by all bodies, keyed by radius in pixels, color and rings.
+            Images are shared between sprites and must not be drawn on.
     """
     referenceRadius = 15
+    imageCache = LRUCache(512)
 
     def __init__(self, radius, color, rings=[], minRadius=1):
         """Create a new Planet.
@@ -73,21 +80,29 @@ class AbstractCelestialBody(AbstractZoomSprite):
         self.redraw()
 
     def redraw(self):
-        """Update sprite drawing of a celestial body."""
+        """Update sprite drawing of a celestial body. Images are taken from imageCache when possible."""
         r = max(self.minRadius, round(self.radius * AbstractCelestialBody.referenceRadius * self.zoom))
+        key = (r, tuple(self.color), tuple(self.rings))
+        self.image = AbstractCelestialBody.imageCache.get(key, AbstractCelestialBody._render)
+        self.rect = self.image.get_rect()
+
+    @staticmethod
+    def _render(key):
+        """Draw a body with rings on a new surface, given (radius in pixels, color, rings)."""
+        r, color, rings = key
         side = r * 2
-        if len(self.rings) > 0:
-            side = max(r + 1, math.ceil(self.rings[-1] * 2 * r))
-        self.image = pygame.Surface([side, side])
-        transparent = (0, 0, 0) if self.color == (0xFF, 0xFF, 0xFF) else (0xFF, 0xFF, 0xFF)
-        self.image.fill(transparent)
-        self.image.set_colorkey(transparent)
-        pygame.draw.circle(self.image, self.color, (side // 2, side // 2), r)
-        for ring in self.rings:
+        if len(rings) > 0:
+            side = max(r + 1, math.ceil(rings[-1] * 2 * r))
+        image = pygame.Surface([side, side])
+        transparent = (0, 0, 0) if color == (0xFF, 0xFF, 0xFF) else (0xFF, 0xFF, 0xFF)
+        image.fill(transparent)
+        image.set_colorkey(transparent)
+        pygame.draw.circle(image, color, (side // 2, side // 2), r)
+        for ring in rings:
             ring = max(r + 1, round(ring * r))
             width = 0 if ring == r + 1 else 1
-            pygame.draw.ellipse(self.image, self.color, (side // 2 - ring, side // 2 - max(1, r // 2), ring * 2, r), width)
-        self.rect = self.image.get_rect()
+            pygame.draw.ellipse(image, color, (side // 2 - ring, side // 2 - max(1, r // 2), ring * 2, r), width)
+        return image
 
 
 class Sun(AbstractCelestialBody):
@@ -108,10 +123,10 @@ class Planet(AbstractCelestialBody):
     """A planet sprite in a Kepler orbit around origo.
     
     Class members:
-        time (datetime.datetime): Date and time in terrestrial time.
+        time (float): Simulation time in seconds since J2000, terrestrial time.
         scale (int): The orbital distance to the central body in m divided by this number gives the distance to origo in pixels when zoom is 1.
     """
-    time = datetime.datetime(2000, 1, 1, 12)
+    time = 0.0
     scale = 1e10
 
     def __init__(self, name, orbit, radius, color, rings=[], minRadius=1):
@@ -127,11 +142,20 @@ class Planet(AbstractCelestialBody):
 
     def update(self, *args):
         """Update screen coordinates to correspond to planet position at Planet.time."""
-        x0, y0 = self.origo
         self.orbit.updatePosition(Planet.time)
         x, y = self.orbit.getCartesianPosition()
         x = x * self.zoom // Planet.scale
         y = -y * self.zoom // Planet.scale # Minus y to convert cartesian coordinate to point on screen
+        self.moveTo(x, y)
+
+    def moveTo(self, x, y):
+        """Center the planet on screen at given pixel offset from origo.
+
+        Args:
+            x (int): Horizontal offset from origo in pixels.
+            y (int): Vertical offset from origo in pixels, positive downwards.
+        """
+        x0, y0 = self.origo
         self.rect.x = x - self.rect.width // 2 + x0
         self.rect.y = y - self.rect.height // 2 + y0
 
@@ -156,34 +180,35 @@ class OrbitEllipse(AbstractZoomSprite):
         self.orbit = orbit
         self.color = color
         self.nSamples = nSamples
-        self.vertices = []
         self.createVertexList()
         self.redraw()
 
     def createVertexList(self):
-        """Trace orbit and save coordinates to a list."""
-        self.vertices.clear()
-        delta = datetime.timedelta(0)
-        timeStep = datetime.timedelta(seconds=self.orbit.T / self.nSamples)
-        for _ in range(self.nSamples):
-            self.orbit.updatePosition(self.orbit.epoch + delta)
-            x, y = self.orbit.getCartesianPosition()
-            self.vertices.append((x, -y))
-            delta += timeStep
+        """Compute the ellipse from the orbital elements and save coordinates in m as an array of shape (nSamples, 2).
+
+        The vertices are spaced so that the direction of the ellipse turns equally much between any two
+        neighbours. This puts them close together where the curvature is high, near the apsides, and far apart
+        along the flat sides, which keeps the deviation from the true ellipse about the same along the trace.
+        """
+        e, a = self.orbit.e, self.orbit.a
+        b = a * math.sqrt(1 - e**2)
+        psi = np.arange(self.nSamples) * 2 * math.pi / self.nSamples # Direction of the tangent
+        E = np.arctan2(-b * np.cos(psi), a * np.sin(psi))
+        x, y = a * (np.cos(E) - e), b * np.sin(E) # Focus at origin, periapsis along the x axis
+        w = self.orbit.O + self.orbit.o
+        self.vertices = np.column_stack((x * math.cos(w) - y * math.sin(w), x * math.sin(w) + y * math.cos(w)))
+        self._points = np.empty(self.vertices.shape, dtype=np.int32)
 
     def redraw(self):
-        """Draw the ellipse and set rect coordinates."""
-        width, height = pygame.display.get_surface().get_size()
-        x0, y0 = width // 2, height // 2
-        self.image = pygame.Surface([width, height])
-        transparent = (0, 0, 0) if self.color == (0xFF, 0xFF, 0xFF) else (0xFF, 0xFF, 0xFF)
-        self.image.fill(transparent)
-        self.image.set_colorkey(transparent)
-        points = []
-        for x, y in self.vertices:
-            points.append((self.zoom * x // self.scale + x0, self.zoom * y // self.scale + y0))
-        self.rect = pygame.draw.polygon(self.image, self.color, points, 1)
-        self.rect.x = self.rect.y = 0
+        """Update the on-screen vertices of the ellipse from zoom and origo."""
+        x0, y0 = self.origo
+        factor = self.zoom / self.scale
+        # Minus y to convert cartesian coordinates to points on screen
+        np.floor(self.vertices * (factor, -factor) + (x0, y0), out=self._points, casting="unsafe")
+
+    def drawOn(self, surface):
+        """Draw the ellipse on given surface and set rect to the area drawn."""
+        self.rect = pygame.draw.polygon(surface, self.color, self._points, 1)
 
 
 class ZoomGroup(pygame.sprite.Group):
@@ -201,11 +226,13 @@ class ZoomGroup(pygame.sprite.Group):
         super().__init__()
 
     def add(self, *sprites):
-        """Add sprites to container. For all AbstractZoomSprite:s, set zoom and origo."""
+        """Add sprites to container. For all AbstractZoomSprite:s, set zoom and origo if they differ."""
         for sprite in sprites:
             if isinstance(sprite, AbstractZoomSprite):
-                sprite.zoom = self._zoom
-                sprite.origo = self._origo
+                if sprite.zoom != self._zoom:
+                    sprite.zoom = self._zoom
+                if sprite.origo != self._origo:
+                    sprite.origo = self._origo
         super().add(*sprites)
 
     @property
@@ -235,28 +262,300 @@ class ZoomGroup(pygame.sprite.Group):
                 sprite.origo = value
 
 
+class TraceGroup(ZoomGroup):
+    """Container of OrbitEllipses that are drawn together on one cached layer.
+
+    The layer is an opaque surface with all traces drawn on the background color. It is only redrawn when zoom,
+    origo, the size of the target surface or the contained sprites change, so drawing the group is a single blit
+    that also clears the screen.
+    """
+
+    def __init__(self, background, zoom=1, origo=(0, 0)):
+        """Create a new TraceGroup.
+
+        Args:
+            background (int, int, int): RGB color behind the traces.
+            zoom (float): Zoom factor.
+            origo (int, int): Coordinate system center.
+        """
+        self.background = background
+        self.layer = None
+        self._dirty = True
+        super().__init__(zoom, origo)
+
+    def add_internal(self, sprite, *args):
+        self._dirty = True
+        super().add_internal(sprite, *args)
+
+    def remove_internal(self, sprite):
+        self._dirty = True
+        super().remove_internal(sprite)
+
+    @ZoomGroup.zoom.setter
+    def zoom(self, value):
+        """Set new zoom value and update all contained OrbitEllipses."""
+        ZoomGroup.zoom.fset(self, value)
+        self._dirty = True
+
+    @ZoomGroup.origo.setter
+    def origo(self, value):
+        """Set new origo and update all contained OrbitEllipses."""
+        ZoomGroup.origo.fset(self, value)
+        self._dirty = True
+
+    def draw(self, surface):
+        """Blit the trace layer to surface, covering all of it. The layer is redrawn first if needed."""
+        if self._dirty or self.layer == None or self.layer.get_size() != surface.get_size():
+            self.redraw(surface)
+        surface.blit(self.layer, (0, 0))
+
+    def redraw(self, surface):
+        """Draw all traces on a new layer matching the size and pixel format of surface."""
+        self.layer = pygame.Surface(surface.get_size(), 0, surface)
+        self.layer.fill(self.background)
+        for sprite in self:
+            sprite.drawOn(self.layer)
+        self._dirty = False
+
+
 class PlanetGroup(ZoomGroup):
-    """Container of sprites with access to Planet orbits in the order they were added."""
+    """Container of sprites with access to Planet orbits in the order they were added.
+
+    Members:
+        orbitSet (OrbitSet): The orbits of all contained planets, propagated together in update().
+        screenSize (int, int): Size of the screen in pixels.
+        spatialIndex (GridIndex): Screen positions of the planets in orbits at the latest update().
+    """
+
+    def __init__(self, *sprites, solver=None):
+        """Create a new PlanetGroup.
 
-    def __init__(self, *sprites):
-        """Create a new PlanetGroup."""
+        Args:
+            solver (KeplerSolver): Solver used to propagate orbitSet. Default is KeplerOrbit.defaultSolver.
+        """
         self.orbits = []
+        self.orbitSet = OrbitSet(solver=solver)
+        self.screenSize = (0, 0)
+        self.spatialIndex = None
+        self._planets = []
         super().__init__()
+        self.add(*sprites)
 
     def add(self, *sprites):
         """Add any type of sprites. If the sprite is a Planet it's orbit is saved together with it's
-            name in the orbits list. Example usage:
+            name and index in orbitSet in the orbits list. Example usage:
                 s = pygame.sprite.Sprite()
                 p1, p2 = Planet("Mars", mOrbit, *args), Planet("Jupiter", jOrbit, *args)
                 pg = PlanetGroup(p1, s, p2)
                 marsName, marsOrbit = pg.orbits[0].name, pg.orbits[0].orbit
-                jupiterName, jupiterOrbit = pg.orbits[1].name, pg.orbits[1].orbit
+                jupiterDistance = pg.orbitSet.r[pg.orbits[1].index]
         """
-        for sprite in sprites:
-            if isinstance(sprite, Planet):
-                self.orbits.append(types.SimpleNamespace(name=sprite.name, orbit=sprite.orbit))
+        planets = [sprite for sprite in sprites if isinstance(sprite, Planet) and not self.has(sprite)]
+        for planet in planets:
+            self.orbits.append(types.SimpleNamespace(name=planet.name, orbit=planet.orbit, index=len(self._planets)))
+            self._planets.append(planet)
+        self.orbitSet.add(*(planet.orbit for planet in planets))
         super().add(*sprites)
 
+    def attachEphemeris(self, ephemeris):
+        """Read planet positions from a precomputed ephemeris whenever it covers Planet.time.
+
+        Args:
+            ephemeris (EphemerisTable): Table with samples for every contained planet, matched by name.
+
+        Raises:
+            KeyError: If a planet is not in the ephemeris.
+        """
+        self.orbitSet.attachEphemeris(ephemeris, ephemeris.index([entry.name for entry in self.orbits]))
+
+    def update(self, *args):
+        """Propagate all planet orbits to Planet.time in one pass and update the screen coordinates of all sprites."""
+        self.orbitSet.updatePositions(Planet.time)
+        xs = np.floor_divide(self.orbitSet.x * self.zoom, Planet.scale)
+        ys = np.floor_divide(-self.orbitSet.y * self.zoom, Planet.scale) # Minus y to convert cartesian coordinate to point on screen
+        self.spatialIndex = GridIndex(xs + self.origo[0], ys + self.origo[1], (0, 0) + tuple(self.screenSize))
+        for planet, x, y in zip(self._planets, xs.tolist(), ys.tolist()):
+            planet.moveTo(x, y)
+        for sprite in self.sprites():
+            if not isinstance(sprite, Planet):
+                sprite.update(*args)
+
+    def pick(self, position, maxDistance):
+        """Return the orbits index of the planet drawn at position, or of the closest one within maxDistance pixels.
+
+        Returns:
+            int: Index in orbits, or None if there is no planet there.
+        """
+        if self.spatialIndex == None:
+            return None
+        for index in self.spatialIndex.visible.tolist():
+            if self._planets[index].rect.collidepoint(position):
+                return index
+        return self.spatialIndex.nearest(position[0], position[1], maxDistance)
+
+
+class PointCloud(AbstractZoomSprite):
+    """Draw many bodies as single pixels on one surface, written in bulk through pygame.surfarray.
+
+    Bodies that fall on the same pixel are counted, and the pixel is drawn brighter the more bodies it holds, up
+    to full color at levels bodies. The image only covers the bounding box of the bodies on screen and black is
+    transparent. A new image is only created when the pixels change, so an unchanged cloud is not redrawn when
+    dirty rendering compares images between frames.
+    """
+
+    def __init__(self, color, levels=8):
+        """Create a new PointCloud.
+
+        Args:
+            color (int, int, int): RGB color of a pixel with levels or more bodies.
+            levels (int): Number of brightness levels.
+        """
+        super().__init__()
+        self.color = color
+        self.levels = levels
+        self.image = pygame.Surface((0, 0), 0, 32)
+        self.rect = self.image.get_rect()
+        self._counts = None
+        self._palette = None
+
+    def setPositions(self, xs, ys, screenSize):
+        """Draw bodies at given pixel offsets from origo. Bodies outside screenSize are skipped.
+
+        Args:
+            xs (numpy.ndarray): Horizontal offsets from origo in pixels.
+            ys (numpy.ndarray): Vertical offsets from origo in pixels, positive downwards.
+            screenSize (int, int): Size of the visible area in pixels.
+        """
+        x0, y0 = self.origo
+        xs, ys = np.asarray(xs, dtype=np.int64) + x0, np.asarray(ys, dtype=np.int64) + y0
+        inside = (xs >= 0) & (xs < screenSize[0]) & (ys >= 0) & (ys < screenSize[1])
+        xs, ys = xs[inside], ys[inside]
+        if len(xs) == 0:
+            if self.rect.size != (0, 0):
+                self.image = pygame.Surface((0, 0), 0, 32)
+                self.rect = self.image.get_rect()
+                self._counts = None
+            return
+        left, top = int(xs.min()), int(ys.min())
+        width, height = int(xs.max()) - left + 1, int(ys.max()) - top + 1
+        counts = np.bincount((xs - left) * height + (ys - top), minlength=width * height)
+        if self._counts is not None and self.rect.topleft == (left, top) and self.rect.size == (width, height) and np.array_equal(counts, self._counts):
+            return
+        self._counts = counts
+        image = pygame.Surface((width, height), 0, 32)
+        image.set_colorkey((0, 0, 0))
+        if self._palette is None:
+            self._palette = np.array([0] + [image.map_rgb([max(1, round(c * (0.4 + 0.6 * level / self.levels))) for c in self.color])
+                for level in range(1, self.levels + 1)], dtype=np.uint32)
+        pixels = pygame.surfarray.pixels2d(image) # Indexed [x, y], locks the image until deleted
+        pixels[...] = self._palette[np.minimum(counts, self.levels)].reshape(width, height)
+        del pixels
+        self.image = image
+        self.rect = image.get_rect(topleft=(left, top))
+
+
+class MinorBodyGroup(ZoomGroup):
+    """Container of sprites for the bodies of a Catalogue, created only for bodies that are on screen.
+
+    All bodies are propagated together in update(). While at most maxSprites bodies are within screenSize each
+    of them gets a Planet sprite. Sprites of bodies that leave the screen are removed from the group and kept
+    in a cache for a while in case they come back. With more bodies on screen than that, they are all drawn
+    as one PointCloud instead, and only the selected body keeps a sprite.
+
+    Members:
+        catalogue (Catalogue): The element table.
+        indices (numpy.ndarray): Catalogue index of every body in orbitSet.
+        orbitSet (OrbitSet): The orbits of the bodies, propagated together in update().
+        screenSize (int, int): Size of the area in pixels where bodies get sprites.
+        selected (int): Position in orbitSet of the selected body, or None.
+        cloud (PointCloud): Drawing of all bodies on screen when there are too many for sprites.
+        spatialIndex (GridIndex): Screen positions of all bodies in orbitSet at the latest update().
+    """
+
+    def __init__(self, catalogue, indices=None, color=(0x80, 0x80, 0x80), maxSprites=500, solver=None):
+        """Create a new MinorBodyGroup.
+
+        Args:
+            catalogue (Catalogue): The element table.
+            indices (numpy.ndarray): Catalogue indices of the bodies to show. All bodies if None.
+            color (int, int, int): RGB color of the sprites.
+            maxSprites (int): Upper bound on the number of sprites in the group.
+            solver (KeplerSolver): Solver used to propagate orbitSet. Default is KeplerOrbit.defaultSolver.
+        """
+        self.catalogue = catalogue
+        self.indices = np.arange(len(catalogue)) if indices is None else np.asarray(indices)
+        self.orbitSet = catalogue.orbitSet(self.indices, solver)
+        self.orbitSet.stepping = True # Consecutive frames are small steps forward in time
+        self._size = len(self.indices) # Bodies after this were only added to be selected
+        self.color = color
+        self.maxSprites = maxSprites
+        self.screenSize = (0, 0)
+        self.selected = None
+        self._cache = LRUCache(2 * maxSprites)
+        self.cloud = PointCloud(color)
+        self.spatialIndex = None
+        super().__init__()
+
+    def select(self, index):
+        """Select the catalogue body at index, adding it to orbitSet if it is not there. None clears the selection.
+
+        A body that was added for the previous selection is removed again, so at most one body outside indices
+        given to __init__() is kept.
+
+        Returns:
+            int: Position of the body in orbitSet, or None.
+        """
+        if len(self.indices) > self._size and (index == None or self.indices[-1] != index):
+            self.orbitSet.truncate(self._size)
+            self.indices = self.indices[:self._size]
+        if index == None:
+            self.selected = None
+            return None
+        positions = np.flatnonzero(self.indices == index)
+        if len(positions) == 0:
+            c = self.catalogue
+            self.orbitSet.addElements(c.e[[index]], c.a[[index]], c.T[[index]], c.O[[index]], c.o[[index]], c.M[[index]], c.MY, i=c.i[[index]])
+            self.indices = np.append(self.indices, index)
+            positions = [len(self.indices) - 1]
+        self.selected = int(positions[0])
+        return self.selected
+
+    def update(self, *args):
+        """Propagate all bodies to Planet.time and draw the ones on screen as sprites or as a point cloud."""
+        self.orbitSet.updatePositions(Planet.time)
+        x0, y0 = self.origo
+        width, height = self.screenSize
+        xs = np.floor_divide(self.orbitSet.x * self.zoom, Planet.scale)
+        ys = np.floor_divide(-self.orbitSet.y * self.zoom, Planet.scale) # Minus y to convert cartesian coordinate to point on screen
+        self.spatialIndex = GridIndex(xs + x0, ys + y0, (0, 0, width, height))
+        visible = self.spatialIndex.visible
+        useCloud = len(visible) > self.maxSprites
+        if useCloud:
+            self.add(self.cloud)
+            self.cloud.setPositions(xs[visible], ys[visible], self.screenSize)
+            visible = []
+        else:
+            visible = visible.tolist()
+        if self.selected != None:
+            visible.append(self.selected)
+        bodies = [self._cache.get(int(self.indices[position]), self._createSprite) for position in visible]
+        keep = set(bodies + [self.cloud] if useCloud else bodies)
+        self.remove(*(sprite for sprite in self.sprites() if sprite not in keep))
+        self.add(*bodies)
+        for sprite, x, y in zip(bodies, xs[visible].tolist(), ys[visible].tolist()):
+            sprite.moveTo(x, y)
+
+    def pick(self, position, maxDistance):
+        """Return the catalogue index of the body closest to position, or None if none is within maxDistance pixels."""
+        if self.spatialIndex == None:
+            return None
+        nearest = self.spatialIndex.nearest(position[0], position[1], maxDistance)
+        return int(self.indices[nearest]) if nearest != None else None
+
+    def _createSprite(self, index):
+        """Return a new Planet sprite for the catalogue body at index."""
+        return Planet(self.catalogue.names[index], self.catalogue.getOrbit(index), 0, self.color)
+
 
 if __name__ == "__main__":
     print("Warning: zoomsprite.py is not intended to run stand-alone.")